@@ -0,0 +1,70 @@
+import os
+import sys
+import zlib
+
+# Compression ratio and CPU cost of the Kinesis record codecs for every fleet,
+# on synthetic trips that follow each fleet's keys. Single trips and 25 KB
+# aggregated records are measured, with and without the schema dictionary.
+# Run from the repository root:
+#   python "Benchmark Scripts/CompressionBenchmark.py" [trips]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common Scripts'))
+from RecordCodec import DICTIONARY_FIELDS, DICTIONARY_IDS, COMPRESSION_LEVEL, MAGIC, LENGTH, serialize_records, compress, deaggregate, zstandard
+from SyntheticTrips import synthetic_trips, timed
+
+
+def aggregated(payloads, target_bytes=25 * 1024):
+    # Same layout as RecordCodec.aggregate_records, without the shard routing
+    records = []
+    parts = []
+    size = len(MAGIC)
+    for payload in payloads:
+        part = LENGTH.pack(len(payload)) + payload
+        if parts and size + len(part) > target_bytes:
+            records.append(MAGIC + b''.join(parts))
+            parts = []
+            size = len(MAGIC)
+        parts.append(part)
+        size += len(part)
+    if parts:
+        records.append(MAGIC + b''.join(parts))
+    return records
+
+
+def deflate(data):
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def measure(records, trip_count, encode, decode=None):
+    encoded, encode_time = timed(lambda: [encode(record) for record in records])
+
+    decode_time = None
+    if decode is not None:
+        decoded, decode_time = timed(lambda: [decode(record) for record in encoded])
+        # Every trip must come back exactly as it was sent
+        if decoded != [deaggregate(record) for record in records]:
+            raise Exception("Decoded payloads differ from the records that were compressed")
+
+    ratio = sum(len(record) for record in records) / sum(len(record) for record in encoded)
+    return ratio, encode_time / trip_count * 1e6, None if decode_time is None else decode_time / trip_count * 1e6
+
+
+if __name__ == '__main__':
+    trip_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    codecs = ['zlib'] + (['zstd'] if zstandard is not None else [])
+
+    print(f'{"fleet":<7} {"records":<11} {"codec":<16} {"ratio":>6} {"encode us/trip":>15} {"decode us/trip":>15}')
+    for fleet in DICTIONARY_FIELDS:
+        payloads = serialize_records(synthetic_trips(fleet, trip_count))
+        for layout, records in (('single', payloads), ('aggregated', aggregated(payloads))):
+            results = [('deflate', measure(records, trip_count, deflate))]
+            for codec in codecs:
+                results.append((f'{codec}+dictionary', measure(
+                    records, trip_count,
+                    lambda record: compress(record, codec, DICTIONARY_IDS[fleet]),
+                    deaggregate
+                )))
+            for name, (ratio, encode_us, decode_us) in results:
+                decode = '-' if decode_us is None else f'{decode_us:.2f}'
+                print(f'{fleet:<7} {layout:<11} {name:<16} {ratio:>6.2f} {encode_us:>15.2f} {decode:>15}')
@@ -0,0 +1,35 @@
+import os
+import sys
+
+# Records per second of the producer serialization, the old iterrows and
+# Series.to_json loop against RecordCodec.serialize_records, on synthetic
+# yellow trips. Run from the repository root:
+#   python "Benchmark Scripts/SerializerBenchmark.py" [trips] [legacy trips]
+# The old loop is slow, pass a smaller legacy count to time it on a sample.
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common Scripts'))
+from RecordCodec import serialize_records
+from SyntheticTrips import synthetic_trips, timed
+
+
+def legacy_serialize(dataframe):
+    return [record.to_json().encode() for _, record in dataframe.iterrows()]
+
+
+if __name__ == '__main__':
+    trip_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    legacy_count = int(sys.argv[2]) if len(sys.argv) > 2 else trip_count
+
+    trips = synthetic_trips('yellow', trip_count)
+
+    payloads, elapsed = timed(serialize_records, trips)
+    vectorized_rate = trip_count / elapsed
+    print(f'serialize_records: {trip_count} trips in {elapsed:.2f}s, {vectorized_rate:,.0f} records/s')
+
+    legacy_payloads, elapsed = timed(legacy_serialize, trips.head(legacy_count))
+    legacy_rate = legacy_count / elapsed
+    print(f'iterrows + to_json: {legacy_count} trips in {elapsed:.2f}s, {legacy_rate:,.0f} records/s')
+
+    if legacy_payloads != payloads[:legacy_count]:
+        raise Exception("Serialized payloads differ from the iterrows output")
+    print(f'Speed-up: {vectorized_rate / legacy_rate:.0f}x, payloads identical')
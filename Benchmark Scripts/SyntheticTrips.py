@@ -0,0 +1,75 @@
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from FleetSchemas import DATETIME, DATETIME_FORMAT, column_types
+from RecordCodec import DICTIONARY_FIELDS
+
+# Synthetic trips shared by the benchmarks: a month of pickups, trips of one
+# minute to an hour, and every key the fleet's producer sends, in its order.
+# Each column is generated for the type FleetSchemas declares for it.
+# The benchmarks put Common Scripts on the path before importing this.
+
+# Values of the string columns
+STRING_VALUES = {
+    'store_and_fwd_flag': ['N', 'Y'],
+    'dispatching_base_num': ['B02764', 'B02510', 'B02869', 'B02617'],
+    'Affiliated_base_number': ['B02764', 'B02510', 'B02869', 'B02617'],
+    'hvfhs_license_num': ['HV0003', 'HV0005'],
+    'originating_base_num': ['B02764', 'B02510', 'B02869', 'B02617'],
+    'shared_request_flag': ['N', 'Y'],
+    'shared_match_flag': ['N', 'Y'],
+    'access_a_ride_flag': ['N', ' '],
+    'wav_request_flag': ['N', 'Y'],
+    'wav_match_flag': ['N', 'Y']
+}
+
+# Code columns as [low, high) ranges, other numbers are amounts or distances
+CODE_RANGES = {
+    'VendorID': (1, 3),
+    'passenger_count': (1, 7),
+    'RatecodeID': (1, 7),
+    'payment_type': (1, 5),
+    'trip_type': (1, 3),
+    'SR_Flag': (0, 2),
+    'PULocationID': (1, 266),
+    'DOLocationID': (1, 266),
+    'PUlocationID': (1, 266),
+    'DOlocationID': (1, 266),
+    'trip_time': (60, 3600)
+}
+
+
+def pickup_dropoff(rng, count):
+    pickup = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 31 * 86400, count), unit='s')
+    dropoff = pickup + pd.to_timedelta(rng.integers(60, 3600, count), unit='s')
+    return pd.Series(pickup), pd.Series(dropoff)
+
+
+def synthetic_timestamps(count, seed=0):
+    return pickup_dropoff(np.random.default_rng(seed), count)
+
+
+def synthetic_trips(fleet, count, seed=0):
+    rng = np.random.default_rng(seed)
+    pickup, dropoff = pickup_dropoff(rng, count)
+    types = column_types(fleet)
+    columns = {}
+    for name in DICTIONARY_FIELDS[fleet]:
+        data_type = types[name]
+        if data_type == DATETIME:
+            times = dropoff if 'dropoff' in name.lower() else pickup
+            columns[name] = times.dt.strftime(DATETIME_FORMAT)
+        elif pa.types.is_string(data_type):
+            columns[name] = rng.choice(STRING_VALUES[name], count)
+        elif name in CODE_RANGES:
+            columns[name] = rng.integers(*CODE_RANGES[name], count).astype(data_type.to_pandas_dtype())
+        else:
+            columns[name] = rng.gamma(2, 5, count).round(2).astype(data_type.to_pandas_dtype())
+    return pd.DataFrame(columns)
+
+
+def timed(function, *arguments):
+    start = time.perf_counter()
+    result = function(*arguments)
+    return result, time.perf_counter() - start
@@ -0,0 +1,53 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Trips per second of the consumer duration and date step: the old
+# pd.to_datetime and dt.date path against TransformPlan's integer path, fed
+# with '%Y-%m-%d %H:%M:%S' strings and with WIRE_TIMESTAMPS=epoch integers.
+# Run from the repository root:
+#   python "Benchmark Scripts/TimestampBenchmark.py" [trips]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common Scripts'))
+from FleetSchemas import DATETIME_FORMAT
+from TransformPlan import epoch_seconds, day_strings
+from SyntheticTrips import synthetic_timestamps, timed
+
+
+def legacy_path(pickup, dropoff):
+    pickup = pd.to_datetime(pickup, format=DATETIME_FORMAT)
+    dropoff = pd.to_datetime(dropoff, format=DATETIME_FORMAT)
+    duration = round((dropoff - pickup).dt.total_seconds() / 60, 2)
+    return duration.to_numpy(), pickup.dt.date.astype(str).to_numpy(dtype=object)
+
+
+def integer_path(pickup, dropoff):
+    pickup, pickup_missing = epoch_seconds(pickup)
+    dropoff, dropoff_missing = epoch_seconds(dropoff)
+    duration = np.round((dropoff - pickup) / 60, 2)
+    duration[pickup_missing | dropoff_missing] = np.nan
+    return duration, day_strings(pickup, pickup_missing)
+
+
+if __name__ == '__main__':
+    trip_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    pickup, dropoff = synthetic_timestamps(trip_count)
+    strings = (pickup.dt.strftime(DATETIME_FORMAT), dropoff.dt.strftime(DATETIME_FORMAT))
+    epochs = (pickup.astype('datetime64[s]').astype(np.int64), dropoff.astype('datetime64[s]').astype(np.int64))
+
+    expected, elapsed = timed(legacy_path, *strings)
+    legacy_rate = trip_count / elapsed
+    print(f'to_datetime + dt.date, strings: {trip_count} trips in {elapsed:.2f}s, {legacy_rate:,.0f} trips/s')
+
+    for name, columns in (('strings', strings), ('epoch', epochs)):
+        result, elapsed = timed(integer_path, *columns)
+        if not (np.array_equal(result[0], expected[0]) and np.array_equal(result[1], expected[1])):
+            raise Exception(f"Integer path on {name} differs from the to_datetime output")
+        rate = trip_count / elapsed
+        print(f'integer path, {name}: {trip_count} trips in {elapsed:.2f}s, {rate:,.0f} trips/s, {rate / legacy_rate:.1f}x')
+
+    string_bytes = len(strings[0].iloc[0]) + 2
+    epoch_bytes = len(str(epochs[0].iloc[0]))
+    print(f'Bytes per timestamp on the wire: {string_bytes} as a string, {epoch_bytes} as epoch seconds')
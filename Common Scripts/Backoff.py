@@ -0,0 +1,14 @@
+import time
+import random
+
+# Retry pacing shared by everything that resends to AWS: the Kinesis sender,
+# the DynamoDB batch writer and the checkpoint index saves.
+
+MAX_ATTEMPTS = 10
+BASE_DELAY = 0.05
+MAX_DELAY = 5.0
+
+
+def backoff(attempt):
+    # Full jitter, so callers throttled together do not retry together
+    time.sleep(random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt)))
@@ -0,0 +1,97 @@
+import os
+import json
+import uuid
+import boto3
+from datetime import datetime, timezone
+from Deduplication import record_key
+
+# The consumers' Kinesis triggers run with ReportBatchItemFailures, so one bad
+# record no longer fails or drops the whole batch:
+#  - a record that cannot be decoded, transformed or stored is quarantined. It
+#    is copied to QUARANTINE_BUCKET with the error and counted as done, so it
+#    never blocks its shard.
+#  - a record whose items were still unwritten after every retry is reported
+#    in batchItemFailures. Lambda then retries the shard from the earliest such
+#    record, so only the tail of the batch is sent again.
+
+QUARANTINE_BUCKET = os.environ.get('QUARANTINE_BUCKET', 'nyc-taxi-quarantine')
+
+
+def trip_record(trip_key):
+    # Trip keys are '<record key>:<index in the record>'
+    return trip_key.rsplit(':', 1)[0]
+
+
+def quarantine_key(fleet, now=None):
+    # <fleet>/date=YYYY-MM-DD/<HHMMSSffffff>-<uuid>.json
+    now = now or datetime.now(timezone.utc)
+    return f'{fleet}/date={now:%Y-%m-%d}/{now:%H%M%S%f}-{uuid.uuid4().hex}.json'
+
+
+class RecordFailures:
+    def __init__(self, event, fleet):
+        self.fleet = fleet
+        # record key -> Kinesis record, in stream order
+        self.records = {record_key(record): record for record in event['Records']}
+        # record key -> error
+        self.quarantined = {}
+        self.failed = set()
+
+    def quarantine(self, key, error):
+        print(f"Quarantined record {key}: {error}")
+        self.quarantined.setdefault(key, str(error))
+
+    def retry(self, key):
+        self.failed.add(key)
+
+    def retry_all(self, error):
+        # Nothing in the batch is known to be written
+        print(f"Failed to process the batch: {error}")
+        self.failed.update(key for key in self.records if key not in self.quarantined)
+
+    def items_failed(self, trip_keys, stats):
+        # Failed items of BatchWriter.write_items, by their position in trip_keys
+        for position, error in stats['rejected'].items():
+            self.quarantine(trip_record(trip_keys[position]), error)
+        for position in stats['unwritten']:
+            self.retry(trip_record(trip_keys[position]))
+
+    def save_quarantine(self):
+        lines = [
+            json.dumps({
+                'eventID': record.get('eventID'),
+                'sequenceNumber': record['kinesis']['sequenceNumber'],
+                'partitionKey': record['kinesis'].get('partitionKey'),
+                'data': record['kinesis']['data'],
+                'error': self.quarantined[key]
+            })
+            for key, record in self.records.items() if key in self.quarantined
+        ]
+        if not QUARANTINE_BUCKET:
+            return
+        try:
+            boto3.client('s3').put_object(
+                Bucket=QUARANTINE_BUCKET,
+                Key=quarantine_key(self.fleet),
+                Body='\n'.join(lines).encode('utf-8')
+            )
+        except Exception as e:
+            # Not kept anywhere, so the records are retried instead
+            print(f"Failed to quarantine {len(lines)} records: {e}")
+            self.failed.update(self.quarantined)
+
+    def response(self, body):
+        if self.quarantined:
+            self.save_quarantine()
+        # Lambda retries from the earliest reported record, report only that one
+        failures = [
+            {'itemIdentifier': record['kinesis']['sequenceNumber']}
+            for key, record in self.records.items() if key in self.failed
+        ][:1]
+        if failures or self.quarantined:
+            print('Batch failures:', {'quarantined': len(self.quarantined), 'retried': len(self.failed)})
+        return {
+            'statusCode': 200,
+            'body': body,
+            'batchItemFailures': failures
+        }
@@ -0,0 +1,26 @@
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import unquote_plus
+
+# Every batch gets its own object, partitioned by fleet and date, so samplers
+# can run side by side and each producer run only handles the object that
+# triggered it.
+
+
+def batch_key(fleet, now=None):
+    # <fleet>/date=YYYY-MM-DD/<HHMMSSffffff>-<uuid>.parquet
+    now = now or datetime.now(timezone.utc)
+    return f'{fleet}/date={now:%Y-%m-%d}/{now:%H%M%S%f}-{uuid.uuid4().hex}.parquet'
+
+
+def event_objects(event):
+    # Objects named by the S3 event notification. Batch keys are unique, so
+    # there is no fixed key left to fall back on when the event names none.
+    records = (event or {}).get('Records', [])
+    objects = [
+        (record['s3']['bucket']['name'], unquote_plus(record['s3']['object']['key']))
+        for record in records if 's3' in record
+    ]
+    if not objects:
+        raise Exception("Failed to find a batch object: the event names no S3 object")
+    return objects
@@ -0,0 +1,97 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError, ParamValidationError
+from Backoff import MAX_ATTEMPTS, backoff
+
+# Writes items to a DynamoDB table with BatchWriteItem, 25 items per request.
+# The chunks are sent concurrently by a small pool of workers, and the items
+# DynamoDB returns as UnprocessedItems are sent again after a jittered backoff
+# until none are left, so throttling slows a write down but never drops trips.
+#
+# Items are reported back by their position in the list: rejected when
+# DynamoDB refuses the item itself, unwritten when it was still unprocessed
+# after every attempt. A chunk with a rejected item is resent one item at a
+# time, so one bad item does not take the other 24 down with it.
+
+MAX_ITEMS_PER_REQUEST = 25
+
+WRITER_WORKERS = int(os.environ.get('WRITER_WORKERS', 4))
+
+# Errors of the whole request that are worth retrying
+RETRYABLE_ERRORS = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded', 'InternalServerError')
+
+
+def request_key(request):
+    return json.dumps(request, sort_keys=True)
+
+
+def write_chunk(dynamodb, table_name, requests, positions, stats, stats_lock):
+    # Send one chunk, then resend only its unprocessed items until none are left.
+    # Returns the rejected positions with their errors and the unwritten positions.
+    pending = positions
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            backoff(attempt)
+            with stats_lock:
+                stats['retries'] += len(pending)
+        with stats_lock:
+            stats['requests'] += 1
+
+        try:
+            response = dynamodb.batch_write_item(RequestItems={table_name: [requests[position] for position in pending]})
+        except (ClientError, ParamValidationError) as e:
+            if isinstance(e, ClientError) and e.response['Error']['Code'] in RETRYABLE_ERRORS:
+                with stats_lock:
+                    stats['throttled'] += len(pending)
+                continue
+            if len(pending) == 1:
+                return {pending[0]: str(e)}, []
+            # Find the bad items by writing the chunk one item at a time
+            rejected = {}
+            unwritten = []
+            for position in pending:
+                item_rejected, item_unwritten = write_chunk(dynamodb, table_name, requests, [position], stats, stats_lock)
+                rejected.update(item_rejected)
+                unwritten.extend(item_unwritten)
+            return rejected, unwritten
+
+        unprocessed = response.get('UnprocessedItems', {}).get(table_name, [])
+        if not unprocessed:
+            return {}, []
+        with stats_lock:
+            stats['unprocessed'] += len(unprocessed)
+        # DynamoDB returns copies of the requests, matched back by content
+        positions_by_key = {request_key(requests[position]): position for position in pending}
+        pending = [positions_by_key[request_key(request)] for request in unprocessed]
+
+    print(f"Failed to write {len(pending)} items to {table_name} after {MAX_ATTEMPTS} attempts")
+    return {}, pending
+
+
+def write_items(dynamodb, table_name, requests, workers=None):
+    # requests: list of {'PutRequest': {'Item': ...}}, at most one per key.
+    # stats['rejected'] maps positions to errors, stats['unwritten'] lists positions.
+    workers = workers or WRITER_WORKERS
+    stats = {'items': len(requests), 'requests': 0, 'retries': 0, 'unprocessed': 0, 'throttled': 0}
+    stats_lock = threading.Lock()
+    chunks = [list(range(i, min(i + MAX_ITEMS_PER_REQUEST, len(requests)))) for i in range(0, len(requests), MAX_ITEMS_PER_REQUEST)]
+
+    start = time.monotonic()
+    rejected = {}
+    unwritten = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_chunk, dynamodb, table_name, requests, chunk, stats, stats_lock) for chunk in chunks]
+        for future in futures:
+            chunk_rejected, chunk_unwritten = future.result()
+            rejected.update(chunk_rejected)
+            unwritten.extend(chunk_unwritten)
+
+    stats['seconds'] = round(time.monotonic() - start, 3)
+    stats['items_per_second'] = round(len(requests) / stats['seconds']) if stats['seconds'] else len(requests)
+    print('Items written:', {**stats, 'rejected': len(rejected), 'unwritten': len(unwritten)})
+    stats['rejected'] = rejected
+    stats['unwritten'] = sorted(unwritten)
+    return stats
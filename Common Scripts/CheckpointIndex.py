@@ -0,0 +1,196 @@
+import io
+import uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from botocore.exceptions import ClientError
+from FleetSchemas import DATETIME_FORMAT
+from SamplerCursor import save_npy
+from Backoff import MAX_ATTEMPTS, backoff
+
+# The checkpoint index is a sorted array of 64-bit row fingerprints stored as
+# one .npy object on S3. Checking whether a row was already sent is a binary
+# search instead of a scan of every record ever sent. The checkpoint table
+# keeps one compact item per batch, from which the index can be rebuilt.
+#
+# Samplers of a fleet may run side by side. Each one saves the index with a
+# conditional PUT on the ETag it read, and a save that lost to another sampler
+# reloads the index and merges its fingerprints again, so none are lost. Two
+# samplers can still pick the same row before either has saved, cursor mode
+# claims disjoint ranges when that matters.
+
+# A conditional PUT lost to another writer
+CONFLICT_ERRORS = ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409')
+
+
+def canonical_frame(table):
+    # One string per value that does not depend on the other rows of the
+    # batch: numbers as floats, datetimes to the second and nulls as 0
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        if pa.types.is_timestamp(column.type):
+            column = pc.cast(column, pa.timestamp('s', column.type.tz), safe=False)
+            column = pc.strftime(column, format=DATETIME_FORMAT)
+        elif pa.types.is_integer(column.type) or pa.types.is_floating(column.type) or pa.types.is_boolean(column.type):
+            column = column.cast(pa.float64())
+        columns[name] = column
+
+    frame = pa.table(columns).to_pandas()
+    frame = frame.fillna(0)
+    frame = frame.replace({None: 0})
+    return frame.astype(str)
+
+
+def row_fingerprints(table):
+    hashes = pd.util.hash_pandas_object(canonical_frame(table), index=False)
+    return hashes.to_numpy(dtype=np.uint64)
+
+
+def checkpoint_item(batch_key, row_count, fingerprints=None, claimed=None):
+    # 8 bytes per sent row in fingerprint mode, or just the claimed range of
+    # positions in cursor mode
+    item = {'ID': str(uuid.uuid4()), 'batch_key': batch_key, 'row_count': row_count}
+    if fingerprints is not None:
+        item['fingerprints'] = fingerprints.astype(np.uint64).tobytes()
+    if claimed is not None:
+        item['range_start'], item['range_stop'] = claimed
+    return item
+
+
+def item_fingerprints(item):
+    # Fingerprints of a compact item, none for cursor, replay and legacy items
+    if 'fingerprints' not in item:
+        return np.empty(0, dtype=np.uint64)
+    return np.frombuffer(bytes(item['fingerprints']), dtype=np.uint64)
+
+
+def index_from_checkpoint(dynamodb_table):
+    # Rebuild the index from the compact checkpoint items
+    scan_args = {'ProjectionExpression': 'fingerprints'}
+    parts = [np.empty(0, dtype=np.uint64)]
+    while True:
+        response = dynamodb_table.scan(**scan_args)
+        parts.extend(item_fingerprints(item) for item in response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return np.unique(np.concatenate(parts))
+
+
+def load_index(s3_client, bucket, key):
+    # The index and the ETag it was read at, None when there is no index yet
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        # Nothing has been sent yet
+        return np.empty(0, dtype=np.uint64), None
+    return np.load(io.BytesIO(response['Body'].read()), allow_pickle=False), response['ETag']
+
+
+def save_index(s3_client, bucket, key, index, etag):
+    # Only replaces the version read at etag, or creates the index when there was none
+    condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    save_npy(s3_client, bucket, key, index, **condition)
+
+
+def record_fingerprints(s3_client, bucket, key, index, etag, fingerprints):
+    # Add the fingerprints to the index read at etag, merging them into the
+    # current index again whenever another sampler saved in between
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            backoff(attempt)
+        try:
+            save_index(s3_client, bucket, key, add_fingerprints(index, fingerprints), etag)
+            return
+        except ClientError as e:
+            if e.response['Error']['Code'] not in CONFLICT_ERRORS:
+                raise
+        index, etag = load_index(s3_client, bucket, key)
+    raise Exception(f"Failed to save the checkpoint index after {MAX_ATTEMPTS} attempts")
+
+
+def contains(index, fingerprints):
+    if len(index) == 0:
+        return np.zeros(len(fingerprints), dtype=bool)
+    positions = np.searchsorted(index, fingerprints)
+    positions = np.minimum(positions, len(index) - 1)
+    return index[positions] == fingerprints
+
+
+def add_fingerprints(index, fingerprints):
+    # Insert the new fingerprints in place so the index stays sorted
+    fingerprints = np.unique(fingerprints)
+    fingerprints = fingerprints[~contains(index, fingerprints)]
+    return np.insert(index, np.searchsorted(index, fingerprints), fingerprints)
+
+
+def select_unsent(table, index, num_records, rng, max_rounds=10, scan_chunk=10000):
+    # Draw random candidate rows and keep the ones whose fingerprint is not in
+    # the index yet. Only the candidates are hashed, never the whole table.
+    positions = []
+    fingerprints = []
+    taken = set()
+
+    def keep(candidates):
+        candidate_fingerprints = row_fingerprints(table.take(pa.array(candidates)))
+        unsent = ~contains(index, candidate_fingerprints)
+        for position, fingerprint in zip(candidates[unsent], candidate_fingerprints[unsent]):
+            if len(positions) == num_records:
+                break
+            if fingerprint in taken:
+                continue
+            taken.add(fingerprint)
+            positions.append(position)
+            fingerprints.append(fingerprint)
+
+    for _ in range(max_rounds):
+        needed = num_records - len(positions)
+        if needed <= 0:
+            break
+        keep(np.unique(rng.integers(0, len(table), size=min(len(table), needed * 2))))
+
+    # Almost everything has been sent, walk the table in order for the rest
+    start = 0
+    while len(positions) < num_records and start < len(table):
+        keep(np.arange(start, min(start + scan_chunk, len(table))))
+        start += scan_chunk
+
+    return np.array(positions, dtype=np.int64), np.array(fingerprints, dtype=np.uint64)
+
+
+def row_group_chunks(parquet_file, group, batch_rows=None):
+    # The whole row group, or record batches of batch_rows rows in chunked mode
+    if not batch_rows:
+        yield parquet_file.read_row_group(group)
+        return
+    for batch in parquet_file.iter_batches(batch_size=batch_rows, row_groups=[group]):
+        yield pa.Table.from_batches([batch])
+
+
+def select_unsent_row_groups(parquet_file, index, num_records, rng, batch_rows=None):
+    # Look for unsent rows one random row group at a time, so only the groups
+    # visited are downloaded
+    batches = []
+    fingerprints = []
+    found = 0
+
+    for group in rng.permutation(parquet_file.num_row_groups):
+        for table in row_group_chunks(parquet_file, int(group), batch_rows):
+            if found == num_records:
+                break
+            positions, chunk_fingerprints = select_unsent(table, index, num_records - found, rng)
+            if len(positions) == 0:
+                continue
+
+            # Rows repeated across groups must not be picked twice
+            index = add_fingerprints(index, chunk_fingerprints)
+            batches.append(table.take(pa.array(positions)))
+            fingerprints.append(chunk_fingerprints)
+            found += len(positions)
+        if found == num_records:
+            break
+
+    if not batches:
+        return parquet_file.schema_arrow.empty_table(), np.empty(0, dtype=np.uint64)
+    return pa.concat_tables(batches), np.concatenate(fingerprints)
@@ -0,0 +1,93 @@
+import sys
+import boto3
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from CheckpointIndex import row_fingerprints, checkpoint_item, item_fingerprints, load_index, record_fingerprints
+from S3Parquet import open_parquet
+from SamplerEngine import SOURCE_BUCKET, FLEETS, checkpoint_key
+
+# One-off migration of a checkpoint table from one item per sent trip (every
+# column stringified) to compact fingerprint items, and of the fingerprint
+# index on S3. Running it again does not change the index, pass delete_old
+# once the result has been checked to drop the old items.
+
+# Fingerprints per compact item, 80 KB of the 400 KB item limit
+FINGERPRINTS_PER_ITEM = 10000
+
+
+def is_legacy_item(item):
+    # Compact, cursor and replay items have none of the source columns
+    return not any(name in item for name in ('fingerprints', 'watermark', 'range_start', 'offset'))
+
+
+def legacy_table(items, schema):
+    # Old items hold the stringified source row, numbers are parsed back so
+    # they hash like the rows read from the source file
+    columns = {}
+    for field in schema:
+        values = pa.array([item.get(field.name, '0') for item in items], type=pa.string())
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type) or pa.types.is_boolean(field.type):
+            values = pc.cast(values, pa.float64())
+        columns[field.name] = values
+    return pa.table(columns)
+
+
+def migrate_fleet(s3_client, dynamodb_resource, fleet, delete_old=False):
+    config = FLEETS[fleet]
+    dynamodb_table = dynamodb_resource.Table(config['checkpoint_table'])
+    schema = open_parquet(s3_client, SOURCE_BUCKET, config['source_key']).schema_arrow
+
+    parts = [np.empty(0, dtype=np.uint64)]
+    migrated = 0
+    scan_args = {}
+    while True:
+        response = dynamodb_table.scan(**scan_args)
+        legacy = [item for item in response['Items'] if is_legacy_item(item)]
+
+        parts.extend(item_fingerprints(item) for item in response['Items'])
+
+        if legacy:
+            fingerprints = row_fingerprints(legacy_table(legacy, schema))
+            parts.append(fingerprints)
+            with dynamodb_table.batch_writer() as batch:
+                for start in range(0, len(fingerprints), FINGERPRINTS_PER_ITEM):
+                    block = fingerprints[start:start + FINGERPRINTS_PER_ITEM]
+                    batch.put_item(Item=checkpoint_item('migrated', len(block), fingerprints=block))
+                if delete_old:
+                    for item in legacy:
+                        batch.delete_item(Key={'ID': item['ID']})
+            migrated += len(legacy)
+
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    # Merged into the current index, samplers may be saving it at the same time
+    fingerprints = np.unique(np.concatenate(parts))
+    index, etag = load_index(s3_client, SOURCE_BUCKET, checkpoint_key(fleet, 'fingerprints'))
+    record_fingerprints(s3_client, SOURCE_BUCKET, checkpoint_key(fleet, 'fingerprints'), index, etag, fingerprints)
+    print(f'{fleet}: migrated {migrated} items, index holds {len(fingerprints)} fingerprints')
+    return migrated
+
+
+def lambda_handler(event, context):
+    # event: {"fleets": ["yellow", ...], "delete_old": true}
+    s3_client = boto3.client('s3')
+    dynamodb_resource = boto3.resource('dynamodb')
+    event = event or {}
+
+    results = {}
+    for fleet in event.get('fleets', list(FLEETS)):
+        results[fleet] = migrate_fleet(s3_client, dynamodb_resource, fleet, event.get('delete_old', False))
+
+    return {
+        'statusCode': 200,
+        'body': results
+    }
+
+
+if __name__ == '__main__':
+    # python CheckpointMigration.py [--delete-old] [fleet ...]
+    arguments = [argument for argument in sys.argv[1:] if argument != '--delete-old']
+    print(lambda_handler({'fleets': arguments or list(FLEETS), 'delete_old': '--delete-old' in sys.argv}, None))
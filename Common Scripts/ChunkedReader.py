@@ -0,0 +1,55 @@
+import os
+import resource
+
+# Chunked mode reads a source in fixed-size Arrow record batches instead of
+# whole row groups, so a run holds about the same memory whatever the size of
+# the monthly file. The batch size comes from a memory budget in MB.
+
+MEMORY_BUDGET_MB = int(os.environ.get('MEMORY_BUDGET_MB', 256))
+
+# Guess for strings and other variable-width values
+VARIABLE_WIDTH_BYTES = 32
+
+# A chunk is decoded, fingerprinted and copied to pandas while it is in memory
+MEMORY_OVERHEAD = 4
+
+
+def estimated_row_bytes(schema):
+    total = 0
+    for field in schema:
+        try:
+            total += max(field.type.bit_width // 8, 1)
+        except ValueError:
+            total += VARIABLE_WIDTH_BYTES
+    return max(total, 1)
+
+
+def rows_for_budget(schema, memory_budget_mb=None):
+    # Rows per record batch that fit in the budget
+    memory_budget_mb = memory_budget_mb or MEMORY_BUDGET_MB
+    budget = memory_budget_mb * 1024 * 1024
+    return max(budget // (estimated_row_bytes(schema) * MEMORY_OVERHEAD), 1)
+
+
+def reset_peak_rss():
+    # Linux resets the process's peak RSS (VmHWM) when 5 is written to
+    # clear_refs, so a warm container can report the peak of one run
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    # VmHWM is the peak since the last reset, ru_maxrss the peak since the
+    # process started. Both are in kilobytes on Linux.
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
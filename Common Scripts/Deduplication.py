@@ -0,0 +1,88 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from RecordCodec import record_trips
+from IdAllocator import allocate_ids
+
+# Kinesis retries a failed batch by delivering every record in it again. With
+# ID_MODE=sequence a trip's ID is derived from its record's eventID (shard and
+# sequence number) and its place inside the record, so a redelivered trip is
+# written over itself instead of being added again under a new ID.
+#
+# Warm containers also remember the records they already wrote, in any mode,
+# and drop them before decoding, so most redeliveries cost no DynamoDB call.
+
+# 'counter' takes IDs from IdAllocator.py, 'sequence' derives them from the record
+ID_MODE = os.environ.get('ID_MODE', 'counter')
+
+# Records remembered per container, 0 turns the check off
+RECENT_RECORDS = int(os.environ.get('RECENT_RECORDS', 100000))
+
+# eventID -> None, least recently seen first
+_recent = OrderedDict()
+_lock = threading.Lock()
+
+
+def record_key(record):
+    # eventID is 'shardId-000000000000:<sequence number>'
+    return record.get('eventID') or record['kinesis']['sequenceNumber']
+
+
+def sequence_id(trip_key):
+    # Positive 63-bit ID, fits a BIGINT in Redshift
+    digest = hashlib.blake2b(trip_key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') >> 1
+
+
+def unseen_trips(event, failures=None):
+    # Keys and decoded trips of the records this container has not written yet.
+    # Records that cannot be decoded are quarantined, see BatchFailures.py
+    keys = []
+    trips = []
+    dropped = 0
+    for record in event['Records']:
+        key = record_key(record)
+        with _lock:
+            seen = key in _recent
+            if seen:
+                _recent.move_to_end(key)
+        if seen:
+            dropped += 1
+            continue
+        try:
+            decoded = [json.loads(payload) for payload in record_trips(record)]
+        except Exception as e:
+            if failures is None:
+                raise
+            failures.quarantine(key, e)
+            continue
+        for index, trip in enumerate(decoded):
+            keys.append(f'{key}:{index}')
+            trips.append(trip)
+    if dropped:
+        print('Redelivered records dropped:', dropped)
+    return keys, trips
+
+
+def remember_records(event, skip=()):
+    # Called once the event's trips are written, skip holds the records to be retried
+    if RECENT_RECORDS <= 0:
+        return
+    with _lock:
+        for record in event['Records']:
+            key = record_key(record)
+            if key in skip:
+                continue
+            _recent[key] = None
+            _recent.move_to_end(key)
+        while len(_recent) > RECENT_RECORDS:
+            _recent.popitem(last=False)
+
+
+def trip_ids(dynamodb, table_name, trip_keys):
+    # One ID per trip key, in order
+    if ID_MODE == 'sequence':
+        return [sequence_id(trip_key) for trip_key in trip_keys]
+    return allocate_ids(dynamodb, table_name, len(trip_keys))
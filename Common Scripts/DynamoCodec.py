@@ -0,0 +1,94 @@
+import pandas as pd
+
+# The DynamoDB item of every fleet as (attribute, type) in table order. The
+# consumers encode a whole transformed frame into items with it, column by
+# column, and the daily exports decode scanned items back into columns, so
+# neither side builds or unpacks {'S': ...} / {'N': ...} by hand per trip.
+#
+# Missing values, and empty strings in number attributes, are left out of the
+# item, since DynamoDB rejects them, and come back from decode() as ''.
+
+YELLOW_ITEM = [
+    ('ID', 'N'), ('Vendor', 'S'), ('date', 'S'), ('RateCode', 'S'), ('Payment', 'S'), ('Trip_Duration', 'N'),
+    ('passenger_count', 'N'), ('trip_distance', 'N'), ('fare_amount', 'N'), ('extra', 'N'), ('mta_tax', 'N'),
+    ('tip_amount', 'N'), ('tolls_amount', 'N'), ('improvement_surcharge', 'N'), ('total_amount', 'N'),
+    ('congestion_surcharge', 'N'), ('airport_fee', 'N'), ('Ingestion_Date', 'S')
+]
+
+GREEN_ITEM = [
+    ('ID', 'N'), ('Vendor', 'S'), ('date', 'S'), ('RateCode', 'S'), ('Payment', 'S'), ('type_of_trip', 'S'),
+    ('Trip_Duration', 'N'), ('passenger_count', 'N'), ('trip_distance', 'N'), ('fare_amount', 'N'), ('extra', 'N'),
+    ('mta_tax', 'N'), ('tip_amount', 'N'), ('tolls_amount', 'N'), ('improvement_surcharge', 'N'),
+    ('total_amount', 'N'), ('congestion_surcharge', 'N'), ('Ingestion_Date', 'S')
+]
+
+FHV_ITEM = [
+    ('ID', 'N'), ('dispatching_base_num', 'S'), ('date', 'S'), ('SR_Flag', 'S'), ('Trip_Duration', 'N'),
+    ('Ingestion_Date', 'S')
+]
+
+HVFHV_ITEM = [
+    ('ID', 'N'), ('hvfhs_license_num', 'S'), ('date', 'S'), ('dispatching_base_num', 'S'), ('Trip_Duration', 'N'),
+    ('trip_miles', 'N'), ('trip_time', 'N'), ('tips', 'N'), ('trip_total_amount', 'N'), ('shared_match_flag', 'S'),
+    ('Ingestion_Date', 'S')
+]
+
+
+class ItemSchema:
+    def __init__(self, attributes):
+        self.attributes = attributes
+        self.names = [name for name, _ in attributes]
+        self.types = dict(attributes)
+
+    def encode(self, dataframe):
+        # One item per row, built from whole encoded columns
+        cells = []
+        complete = True
+        for name, data_type in self.attributes:
+            values = dataframe[name].to_numpy(dtype=object)
+            missing = pd.isna(values)
+            if data_type == 'N':
+                missing |= values == ''
+            # Numbers as Python prints them, like str(value) per trip did
+            encoded = list(map(str, values.tolist()))
+            if missing.any():
+                complete = False
+                cells.append([None if skip else {data_type: value} for value, skip in zip(encoded, missing.tolist())])
+            else:
+                cells.append([{data_type: value} for value in encoded])
+
+        if complete:
+            return [dict(zip(self.names, row)) for row in zip(*cells)]
+        return [
+            {name: cell for name, cell in zip(self.names, row) if cell is not None}
+            for row in zip(*cells)
+        ]
+
+    def put_requests(self, dataframe):
+        return [{'PutRequest': {'Item': item}} for item in self.encode(dataframe)]
+
+    def decode(self, items, columns=None):
+        # Column -> values as stored, in the order of columns, '' where an item has no value
+        decoded = {}
+        for name in columns or self.names:
+            data_type = self.types[name]
+            values = []
+            for item in items:
+                attribute = item.get(name)
+                if attribute is None:
+                    values.append('')
+                elif data_type in attribute:
+                    values.append(attribute[data_type])
+                else:
+                    # Written with another type by an older consumer
+                    values.append(next(iter(attribute.values())))
+            decoded[name] = values
+        return decoded
+
+
+ITEM_SCHEMAS = {
+    'yellow': ItemSchema(YELLOW_ITEM),
+    'green': ItemSchema(GREEN_ITEM),
+    'fhv': ItemSchema(FHV_ITEM),
+    'hvfhv': ItemSchema(HVFHV_ITEM)
+}
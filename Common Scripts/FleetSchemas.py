@@ -0,0 +1,144 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Batch schema of every fleet as (column, type, value used for nulls).
+# Datetimes are written as strings in the form the consumers parse, columns
+# that are not listed keep the type they have in the source file.
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+DATETIME = 'datetime'
+
+YELLOW_COLUMNS = [
+    ('VendorID', pa.int64(), 0),
+    ('tpep_pickup_datetime', DATETIME, None),
+    ('tpep_dropoff_datetime', DATETIME, None),
+    ('passenger_count', pa.float64(), 0),
+    ('trip_distance', pa.float64(), 0),
+    ('RatecodeID', pa.float64(), 0),
+    ('store_and_fwd_flag', pa.string(), '0'),
+    ('payment_type', pa.float64(), 0),
+    ('fare_amount', pa.float64(), 0),
+    ('extra', pa.float64(), 0),
+    ('mta_tax', pa.float64(), 0),
+    ('tip_amount', pa.float64(), 0),
+    ('tolls_amount', pa.float64(), 0),
+    ('improvement_surcharge', pa.float64(), 0),
+    ('total_amount', pa.float64(), 0),
+    ('congestion_surcharge', pa.float64(), 0),
+    ('airport_fee', pa.float64(), 0)
+]
+
+GREEN_COLUMNS = [
+    ('VendorID', pa.int64(), 0),
+    ('lpep_pickup_datetime', DATETIME, None),
+    ('lpep_dropoff_datetime', DATETIME, None),
+    ('store_and_fwd_flag', pa.string(), '0'),
+    ('RatecodeID', pa.float64(), 0),
+    ('passenger_count', pa.float64(), 0),
+    ('trip_distance', pa.float64(), 0),
+    ('fare_amount', pa.float64(), 0),
+    ('extra', pa.float64(), 0),
+    ('mta_tax', pa.float64(), 0),
+    ('tip_amount', pa.float64(), 0),
+    ('tolls_amount', pa.float64(), 0),
+    ('improvement_surcharge', pa.float64(), 0),
+    ('total_amount', pa.float64(), 0),
+    ('payment_type', pa.float64(), 0),
+    ('trip_type', pa.float64(), 0),
+    ('congestion_surcharge', pa.float64(), 0)
+]
+
+FHV_COLUMNS = [
+    ('dispatching_base_num', pa.string(), '0'),
+    ('pickup_datetime', DATETIME, None),
+    ('dropOff_datetime', DATETIME, None),
+    ('SR_Flag', pa.int64(), 0),
+    ('Affiliated_base_number', pa.string(), '0')
+]
+
+HVFHV_COLUMNS = [
+    ('hvfhs_license_num', pa.string(), '0'),
+    ('dispatching_base_num', pa.string(), '0'),
+    ('originating_base_num', pa.string(), '0'),
+    ('request_datetime', DATETIME, None),
+    ('on_scene_datetime', DATETIME, None),
+    ('pickup_datetime', DATETIME, None),
+    ('dropoff_datetime', DATETIME, None),
+    ('trip_miles', pa.float64(), 0),
+    ('trip_time', pa.int64(), 0),
+    ('base_passenger_fare', pa.float64(), 0),
+    ('tolls', pa.float64(), 0),
+    ('bcf', pa.float64(), 0),
+    ('sales_tax', pa.float64(), 0),
+    ('congestion_surcharge', pa.float64(), 0),
+    ('airport_fee', pa.float64(), 0),
+    ('tips', pa.float64(), 0),
+    ('driver_pay', pa.float64(), 0),
+    ('shared_request_flag', pa.string(), '0'),
+    ('shared_match_flag', pa.string(), '0'),
+    ('access_a_ride_flag', pa.string(), '0'),
+    ('wav_request_flag', pa.string(), '0'),
+    ('wav_match_flag', pa.string(), '0')
+]
+
+FLEET_COLUMNS = {
+    'yellow': YELLOW_COLUMNS,
+    'green': GREEN_COLUMNS,
+    'fhv': FHV_COLUMNS,
+    'hvfhv': HVFHV_COLUMNS
+}
+
+# Columns the batches keep from the source file, with their type in the TLC files
+SOURCE_COLUMNS = {
+    'yellow': [('PULocationID', pa.int64()), ('DOLocationID', pa.int64())],
+    'green': [('PULocationID', pa.int64()), ('DOLocationID', pa.int64()), ('ehail_fee', pa.float64())],
+    'fhv': [('PUlocationID', pa.float64()), ('DOlocationID', pa.float64())],
+    'hvfhv': [('PULocationID', pa.int64()), ('DOLocationID', pa.int64())]
+}
+
+
+def column_types(fleet):
+    # Column -> type of every value a fleet's trips carry, DATETIME for datetimes
+    types = {name: data_type for name, data_type, _ in FLEET_COLUMNS[fleet]}
+    types.update(SOURCE_COLUMNS[fleet])
+    return types
+
+
+def conform_table(table, fleet):
+    # Cast and fill each declared column in Arrow, without going through pandas
+    for name, data_type, fill in FLEET_COLUMNS[fleet]:
+        if name not in table.column_names:
+            continue
+        column = table.column(name)
+
+        if data_type == DATETIME:
+            if pa.types.is_timestamp(column.type):
+                # %S prints fractions unless the unit is already seconds
+                column = pc.cast(column, pa.timestamp('s', column.type.tz), safe=False)
+                column = pc.strftime(column, format=DATETIME_FORMAT)
+            elif pa.types.is_date(column.type):
+                column = pc.strftime(column, format=DATETIME_FORMAT)
+            else:
+                column = column.cast(pa.string())
+        else:
+            column = column.cast(data_type)
+
+        if fill is not None and column.null_count:
+            column = pc.fill_null(column, pa.scalar(fill, type=column.type))
+        table = table.set_column(table.column_names.index(name), name, column)
+
+    return table
+
+
+def epoch_timestamps(table, fleet):
+    # Datetime strings as integer seconds since the epoch, for WIRE_TIMESTAMPS=epoch.
+    # The strings have no time zone, so the seconds count wall-clock time.
+    for name, data_type, fill in FLEET_COLUMNS[fleet]:
+        if data_type != DATETIME or name not in table.column_names:
+            continue
+        column = table.column(name)
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            column = pc.strptime(column, format=DATETIME_FORMAT, unit='s')
+        column = pc.cast(column, pa.int64())
+        table = table.set_column(table.column_names.index(name), name, column)
+    return table
@@ -0,0 +1,83 @@
+import os
+import threading
+from botocore.exceptions import ClientError
+
+# Trip IDs come from one counter item per table, moved forward with a single
+# atomic ADD. Each call reserves a block of IDs and warm containers hand out
+# the rest of the block on later invocations, so no consumer scans the table
+# and concurrent shards never get the same ID. IDs are unique, not gapless.
+#
+# The counter table has a string partition key 'name' and is seeded once from
+# the largest ID already in the trip table.
+
+ID_COUNTER_TABLE = os.environ.get('ID_COUNTER_TABLE', 'IdCounters')
+ID_BLOCK_SIZE = int(os.environ.get('ID_BLOCK_SIZE', 1000))
+
+# table name -> [next unused ID, last reserved ID]
+_ranges = {}
+_lock = threading.Lock()
+
+
+def scan_max_id(dynamodb, table_name):
+    # Only used to seed a counter that does not exist yet
+    max_id = 0
+    arguments = {'TableName': table_name, 'ProjectionExpression': 'ID'}
+    while True:
+        response = dynamodb.scan(**arguments)
+        for item in response['Items']:
+            max_id = max(max_id, int(item['ID']['N']))
+        if 'LastEvaluatedKey' not in response:
+            return max_id
+        arguments['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def seed_counter(dynamodb, table_name):
+    try:
+        dynamodb.put_item(
+            TableName=ID_COUNTER_TABLE,
+            Item={'name': {'S': table_name}, 'next_id': {'N': str(scan_max_id(dynamodb, table_name))}},
+            ConditionExpression='attribute_not_exists(next_id)'
+        )
+    except ClientError as e:
+        # Another consumer seeded it first
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+def reserve_block(dynamodb, table_name, count):
+    # Returns the first and last ID of a fresh block of count IDs
+    for _ in range(2):
+        try:
+            response = dynamodb.update_item(
+                TableName=ID_COUNTER_TABLE,
+                Key={'name': {'S': table_name}},
+                UpdateExpression='ADD next_id :count',
+                ConditionExpression='attribute_exists(next_id)',
+                ExpressionAttributeValues={':count': {'N': str(count)}},
+                ReturnValues='UPDATED_NEW'
+            )
+            last = int(response['Attributes']['next_id']['N'])
+            return last - count + 1, last
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            seed_counter(dynamodb, table_name)
+    raise Exception(f"Failed to reserve IDs for {table_name}")
+
+
+def allocate_ids(dynamodb, table_name, count):
+    # count unique IDs, from the cached block first
+    ids = []
+    with _lock:
+        cached = _ranges.get(table_name)
+        if cached is not None:
+            take = min(count, cached[1] - cached[0] + 1)
+            ids.extend(range(cached[0], cached[0] + take))
+            cached[0] += take
+
+        missing = count - len(ids)
+        if missing:
+            first, last = reserve_block(dynamodb, table_name, max(missing, ID_BLOCK_SIZE))
+            ids.extend(range(first, first + missing))
+            _ranges[table_name] = [first + missing, last]
+    return ids
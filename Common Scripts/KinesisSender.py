@@ -0,0 +1,245 @@
+import os
+import time
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from Backoff import MAX_ATTEMPTS, backoff
+from Partitioning import open_shards, shard_index
+
+# Sends records to a Kinesis stream with PutRecords, up to 500 records and
+# 5 MB per request. Only the entries that come back with an ErrorCode are sent
+# again, after a jittered backoff, so a throttled shard never fails the batch.
+#
+# With PRODUCER_WORKERS above 1 the records are split by shard and every shard
+# is sent by its own worker, so several requests are in flight at once. Each
+# shard is held to its write limits by token buckets, and the request size
+# shrinks when Kinesis throttles and grows back while it does not.
+#
+# Order is not guaranteed, not even within a shard: when an entry of a request
+# fails, the entries after it may already be stored, and the failed one is
+# sent again after them.
+
+MAX_RECORDS_PER_REQUEST = 500
+MAX_BYTES_PER_REQUEST = 5 * 1024 * 1024
+
+# Data plus partition key of a single record
+MAX_RECORD_BYTES = 1024 * 1024
+
+# Write limits of one shard
+SHARD_BYTES_PER_SECOND = 1024 * 1024
+SHARD_RECORDS_PER_SECOND = 1000
+
+PRODUCER_WORKERS = int(os.environ.get('PRODUCER_WORKERS', 4))
+
+# Smallest request the adaptive batch size shrinks to
+MIN_RECORDS_PER_REQUEST = 10
+
+# (stream name, shard ID) -> token buckets, kept by warm containers so
+# back-to-back invocations share the shard's budget
+_limits = {}
+_limits_lock = threading.Lock()
+
+# stream name -> AdaptiveBatchSize, kept the same way so the size learned from
+# throttling carries over to the next chunk and the next invocation
+_batch_sizes = {}
+
+# Errors of the whole request that are worth retrying
+RETRYABLE_ERRORS = ('ProvisionedThroughputExceededException', 'KMSThrottlingException', 'ThrottlingException', 'InternalFailure', 'ServiceUnavailable')
+
+
+def record_size(entry):
+    return len(entry['Data']) + len(entry['PartitionKey'].encode())
+
+
+def check_size(entry):
+    size = record_size(entry)
+    if size > MAX_RECORD_BYTES:
+        raise Exception(f"Record of {size} bytes is over the Kinesis limit of {MAX_RECORD_BYTES} bytes")
+    return size
+
+
+def request_batches(entries):
+    # Group entries into requests that stay under both PutRecords limits
+    batch = []
+    batch_bytes = 0
+    for entry in entries:
+        size = check_size(entry)
+        if batch and (len(batch) == MAX_RECORDS_PER_REQUEST or batch_bytes + size > MAX_BYTES_PER_REQUEST):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(entry)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def put_records(kinesis_client, stream_name, entries, stats):
+    # Send one request, then resend only the failed entries until none are left
+    pending = entries
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            backoff(attempt)
+            stats['retries'] += len(pending)
+        stats['requests'] += 1
+
+        try:
+            response = kinesis_client.put_records(StreamName=stream_name, Records=pending)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in RETRYABLE_ERRORS:
+                raise
+            stats['throttled'] += len(pending)
+            continue
+
+        stats['shards'].update(result['ShardId'] for result in response['Records'] if 'ShardId' in result)
+        if not response.get('FailedRecordCount'):
+            return
+        failed = [entry for entry, result in zip(pending, response['Records']) if 'ErrorCode' in result]
+        stats['throttled'] += sum(1 for result in response['Records'] if result.get('ErrorCode') == 'ProvisionedThroughputExceededException')
+        pending = failed
+
+    raise Exception(f"Failed to send {len(pending)} records to {stream_name} after {MAX_ATTEMPTS} attempts")
+
+
+class TokenBucket:
+    # take() waits until the bucket holds the amount, or a full bucket for
+    # amounts bigger than its capacity, which then leaves it in debt
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, amount):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= min(amount, self.capacity):
+                    self.tokens -= amount
+                    return
+                wait = (min(amount, self.capacity) - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveBatchSize:
+    # Halved on every throttled request, grown by a tenth after a clean one
+    def __init__(self):
+        self.size = MAX_RECORDS_PER_REQUEST
+        self.lock = threading.Lock()
+
+    def throttled(self):
+        with self.lock:
+            self.size = max(MIN_RECORDS_PER_REQUEST, self.size // 2)
+
+    def succeeded(self):
+        with self.lock:
+            self.size = min(MAX_RECORDS_PER_REQUEST, self.size + max(self.size // 10, 1))
+
+
+def next_request(queue, limit):
+    # Take entries from the front of the queue up to limit records and 5 MB
+    request = []
+    request_bytes = 0
+    while queue and len(request) < limit:
+        size = record_size(queue[0])
+        if request and request_bytes + size > MAX_BYTES_PER_REQUEST:
+            break
+        request.append(queue.popleft())
+        request_bytes += size
+    return request, request_bytes
+
+
+def send_shard(kinesis_client, stream_name, entries, limits, batch_size, stats, stats_lock):
+    # Records of one shard, failed entries go back to the front of the queue
+    queue = deque(entries)
+    failures = 0
+    while queue:
+        request, request_bytes = next_request(queue, batch_size.size)
+        limits['records'].take(len(request))
+        limits['bytes'].take(request_bytes)
+
+        try:
+            response = kinesis_client.put_records(StreamName=stream_name, Records=request)
+            results = response['Records']
+        except ClientError as e:
+            if e.response['Error']['Code'] not in RETRYABLE_ERRORS:
+                raise
+            results = [{'ErrorCode': e.response['Error']['Code']} for _ in request]
+
+        failed = [entry for entry, result in zip(request, results) if 'ErrorCode' in result]
+        throttled = sum(1 for result in results if result.get('ErrorCode') in RETRYABLE_ERRORS)
+        with stats_lock:
+            stats['requests'] += 1
+            stats['records'] += len(request) - len(failed)
+            stats['retries'] += len(failed)
+            stats['throttled'] += throttled
+            stats['shards'].update(result['ShardId'] for result in results if 'ShardId' in result)
+
+        if not failed:
+            batch_size.succeeded()
+            failures = 0
+            continue
+
+        if throttled:
+            batch_size.throttled()
+        # Gives up after MAX_ATTEMPTS requests in a row that sent nothing
+        failures = failures + 1 if len(failed) == len(request) else 1
+        if failures == MAX_ATTEMPTS:
+            raise Exception(f"Failed to send {len(failed)} records to {stream_name} after {MAX_ATTEMPTS} attempts")
+        queue.extendleft(reversed(failed))
+        backoff(failures)
+
+
+def shard_limits(stream_name, shard_id):
+    with _limits_lock:
+        if (stream_name, shard_id) not in _limits:
+            _limits[(stream_name, shard_id)] = {'records': TokenBucket(SHARD_RECORDS_PER_SECOND), 'bytes': TokenBucket(SHARD_BYTES_PER_SECOND)}
+        return _limits[(stream_name, shard_id)]
+
+
+def stream_batch_size(stream_name):
+    with _limits_lock:
+        if stream_name not in _batch_sizes:
+            _batch_sizes[stream_name] = AdaptiveBatchSize()
+        return _batch_sizes[stream_name]
+
+
+def send_records_concurrent(kinesis_client, stream_name, entries, workers):
+    shards = open_shards(kinesis_client, stream_name)
+    by_shard = {}
+    for entry in entries:
+        check_size(entry)
+        by_shard.setdefault(shard_index(shards, entry), []).append(entry)
+
+    stats = {'records': 0, 'requests': 0, 'retries': 0, 'throttled': 0, 'shards': Counter()}
+    stats_lock = threading.Lock()
+    batch_size = stream_batch_size(stream_name)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                send_shard, kinesis_client, stream_name, shard_entries,
+                shard_limits(stream_name, shards[index]['ShardId']),
+                batch_size, stats, stats_lock
+            )
+            for index, shard_entries in by_shard.items()
+        ]
+        for future in futures:
+            future.result()
+    return stats
+
+
+def send_records(kinesis_client, stream_name, entries, workers=None):
+    # entries: iterable of {'Data': bytes, 'PartitionKey': str}, optionally with an ExplicitHashKey
+    workers = workers or PRODUCER_WORKERS
+    if workers > 1:
+        return send_records_concurrent(kinesis_client, stream_name, entries, workers)
+
+    stats = {'records': 0, 'requests': 0, 'retries': 0, 'throttled': 0, 'shards': Counter()}
+    for batch in request_batches(entries):
+        put_records(kinesis_client, stream_name, batch, stats)
+        stats['records'] += len(batch)
+    return stats
@@ -0,0 +1,44 @@
+import os
+import random
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from SamplerEngine import FLEETS, sample_fleet
+
+# Advances every fleet in one invocation, so the container and pandas/pyarrow
+# are only started once. The work is mostly S3 and DynamoDB calls, so the
+# fleets run side by side in a thread pool.
+
+
+def lambda_handler(event, context):
+    # Fleets to advance and the batch size range, the same for every fleet
+    fleets = os.environ.get('SAMPLER_FLEETS', ','.join(FLEETS)).split(',')
+    min_records = int(os.environ.get('MIN_RECORDS', 1))
+    max_records = int(os.environ.get('MAX_RECORDS', 100))
+    max_workers = int(os.environ.get('SAMPLER_WORKERS', len(fleets)))
+
+    # boto3 clients can be shared between threads, resources can not
+    s3_client = boto3.client('s3')
+
+    def run(fleet):
+        dynamodb_resource = boto3.session.Session().resource('dynamodb')
+        num_records = random.randint(min_records, max_records)
+        return sample_fleet(fleet, s3_client, dynamodb_resource, num_records, min_records, max_records)
+
+    results = []
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {fleet: executor.submit(run, fleet) for fleet in fleets}
+        for fleet, future in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failures.append(f'{fleet}: {e}')
+
+    print('Records sents are:', {result['fleet']: result['records'] for result in results})
+    if failures:
+        raise Exception(f"Failed to sample {len(failures)} fleet(s): {'; '.join(failures)}")
+
+    return {
+        'statusCode': 200,
+        'body': results
+    }
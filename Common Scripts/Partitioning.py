@@ -0,0 +1,94 @@
+import os
+import uuid
+import hashlib
+import random
+
+# Partition key strategies for the producers. Kinesis maps the MD5 of the
+# partition key to a shard, so a key with many distinct values spreads the
+# records over every shard while records that share a key land on the same
+# shard. Retried entries can still arrive after later ones, see KinesisSender.py
+#   pickup_location  one key per pickup zone (default)
+#   vendor           one key per vendor (yellow, green) or dispatching base (fhv, hvfhv)
+#   trip_id          a fresh key per trip, even spread and no ordering
+#   hash_ranges      explicit hash keys that deal records to the open shards in turn
+#   single           the old constant key, everything on one shard
+
+PARTITION_STRATEGY = os.environ.get('PARTITION_STRATEGY', 'pickup_location')
+
+PARTITION_COLUMNS = {
+    'yellow': {'pickup_location': 'PULocationID', 'vendor': 'VendorID'},
+    'green': {'pickup_location': 'PULocationID', 'vendor': 'VendorID'},
+    'fhv': {'pickup_location': 'PUlocationID', 'vendor': 'dispatching_base_num'},
+    'hvfhv': {'pickup_location': 'PULocationID', 'vendor': 'dispatching_base_num'}
+}
+
+# stream name -> open shards, listed once per warm container
+_shards = {}
+
+
+def open_shards(kinesis_client, stream_name):
+    if stream_name not in _shards:
+        shards = []
+        arguments = {'StreamName': stream_name}
+        while True:
+            response = kinesis_client.list_shards(**arguments)
+            # Closed parent shards keep an ending sequence number after a reshard
+            shards += [shard for shard in response['Shards'] if 'EndingSequenceNumber' not in shard['SequenceNumberRange']]
+            if not response.get('NextToken'):
+                break
+            arguments = {'NextToken': response['NextToken']}
+        _shards[stream_name] = shards
+    return _shards[stream_name]
+
+
+def hash_key(entry):
+    if 'ExplicitHashKey' in entry:
+        return int(entry['ExplicitHashKey'])
+    return int(hashlib.md5(entry['PartitionKey'].encode()).hexdigest(), 16)
+
+
+def shard_index(shards, entry):
+    # Position in shards of the shard Kinesis will route the entry to
+    key = hash_key(entry)
+    for index, shard in enumerate(shards):
+        if int(shard['HashKeyRange']['StartingHashKey']) <= key <= int(shard['HashKeyRange']['EndingHashKey']):
+            return index
+    return 0
+
+
+def partition_keys(kinesis_client, stream_name, dataframe, fleet, strategy=None):
+    # One {'PartitionKey': ...} per row of the frame, with an ExplicitHashKey for hash_ranges
+    strategy = strategy or PARTITION_STRATEGY
+
+    if strategy == 'single':
+        return [{'PartitionKey': str(1)} for _ in range(len(dataframe))]
+
+    if strategy == 'hash_ranges':
+        shards = open_shards(kinesis_client, stream_name)
+        first = random.randrange(len(shards))
+        keys = []
+        for row in range(len(dataframe)):
+            shard = shards[(first + row) % len(shards)]
+            keys.append({'PartitionKey': shard['ShardId'], 'ExplicitHashKey': shard['HashKeyRange']['StartingHashKey']})
+        return keys
+
+    column = PARTITION_COLUMNS[fleet].get(strategy)
+    if strategy == 'trip_id' or column not in dataframe.columns:
+        # Batches without the column are spread evenly instead of piling on one key
+        return [{'PartitionKey': uuid.uuid4().hex} for _ in range(len(dataframe))]
+
+    return [{'PartitionKey': str(value)} for value in dataframe[column].tolist()]
+
+
+def shard_skew(kinesis_client, stream_name, shard_counts):
+    # Busiest shard against an even spread over all open shards, 1.0 is perfect
+    total = sum(shard_counts.values())
+    if total == 0:
+        return {'shards': 0, 'busiest': None, 'skew': 0.0}
+    shard_count = max(len(open_shards(kinesis_client, stream_name)), len(shard_counts))
+    busiest = max(shard_counts, key=shard_counts.get)
+    return {
+        'shards': len(shard_counts),
+        'busiest': busiest,
+        'skew': round(shard_counts[busiest] / (total / shard_count), 2)
+    }
@@ -0,0 +1,244 @@
+import os
+import json
+import zlib
+import base64
+import struct
+import pyarrow as pa
+from FleetSchemas import DATETIME, column_types
+from Partitioning import open_shards, shard_index
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Aggregated Kinesis records pack many trips into one record, so a shard hits
+# its 1 MB/s limit instead of its 1000 records/s one. The layout is
+#   MAGIC, then for every trip a 4-byte big-endian length and the trip's JSON
+# Plain JSON records start with '{', so consumers tell the two apart by the
+# first bytes and still read records sent before aggregation was turned on.
+#
+# Compressed records wrap a plain or aggregated record as
+#   COMPRESSED_MAGIC, a codec byte, a dictionary byte, then the compressed body
+# The dictionary is built from the fleet's JSON keys, which make up most of a
+# small trip record, so even single trips compress well.
+
+MAGIC = b'\xa7\x01'
+LENGTH = struct.Struct('>I')
+
+COMPRESSED_MAGIC = b'\xa7\x02'
+CODECS = {'zlib': 1, 'zstd': 2}
+
+# Size target of one aggregated record, 0 sends one record per trip.
+# PUT payload units are counted per 25 KB.
+AGGREGATION_BYTES = int(os.environ.get('AGGREGATION_BYTES', 25 * 1024))
+
+# none, zlib, or zstd when the zstandard package is in the layer
+RECORD_COMPRESSION = os.environ.get('RECORD_COMPRESSION', 'none')
+COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', 6))
+
+# Keys of each fleet's trips in the order the producers write them. The id is
+# written in the header, so a dictionary can only change under a new id.
+DICTIONARY_IDS = {'yellow': 1, 'green': 2, 'fhv': 3, 'hvfhv': 4}
+DICTIONARY_FIELDS = {
+    'yellow': [
+        'VendorID', 'tpep_pickup_datetime', 'tpep_dropoff_datetime', 'passenger_count', 'trip_distance',
+        'RatecodeID', 'store_and_fwd_flag', 'PULocationID', 'DOLocationID', 'payment_type', 'fare_amount',
+        'extra', 'mta_tax', 'tip_amount', 'tolls_amount', 'improvement_surcharge', 'total_amount',
+        'congestion_surcharge', 'airport_fee'
+    ],
+    'green': [
+        'VendorID', 'lpep_pickup_datetime', 'lpep_dropoff_datetime', 'store_and_fwd_flag', 'RatecodeID',
+        'PULocationID', 'DOLocationID', 'passenger_count', 'trip_distance', 'fare_amount', 'extra', 'mta_tax',
+        'tip_amount', 'tolls_amount', 'ehail_fee', 'improvement_surcharge', 'total_amount', 'payment_type',
+        'trip_type', 'congestion_surcharge'
+    ],
+    'fhv': [
+        'dispatching_base_num', 'pickup_datetime', 'dropOff_datetime', 'PUlocationID', 'DOlocationID',
+        'SR_Flag', 'Affiliated_base_number'
+    ],
+    'hvfhv': [
+        'hvfhs_license_num', 'dispatching_base_num', 'originating_base_num', 'request_datetime',
+        'on_scene_datetime', 'pickup_datetime', 'dropoff_datetime', 'PULocationID', 'DOLocationID',
+        'trip_miles', 'trip_time', 'base_passenger_fare', 'tolls', 'bcf', 'sales_tax', 'congestion_surcharge',
+        'airport_fee', 'tips', 'driver_pay', 'shared_request_flag', 'shared_match_flag', 'access_a_ride_flag',
+        'wav_request_flag', 'wav_match_flag'
+    ]
+}
+
+# Value of each string column in the dictionaries, the most common one. Numbers
+# and datetimes get a zero of the type declared in FleetSchemas.
+DICTIONARY_STRINGS = {
+    'store_and_fwd_flag': 'N',
+    'dispatching_base_num': 'B02764',
+    'Affiliated_base_number': 'B02764',
+    'hvfhs_license_num': 'HV0003',
+    'originating_base_num': 'B02764',
+    'shared_request_flag': 'N',
+    'shared_match_flag': 'N',
+    'access_a_ride_flag': 'N',
+    'wav_request_flag': 'N',
+    'wav_match_flag': 'N'
+}
+
+# Dictionaries, zstd compressors and decompressors, built once per container.
+# Producers and consumers compress from a single thread.
+_codecs = {}
+
+
+def serialize_records(dataframe):
+    # JSON of every row, encoded for the whole frame in one pass. Same objects
+    # as Series.to_json per row, newlines inside strings are escaped.
+    if dataframe.empty:
+        return []
+    lines = dataframe.to_json(orient='records', lines=True).encode().split(b'\n')
+    return [line for line in lines if line]
+
+
+def aggregate_records(kinesis_client, stream_name, entries, target_bytes=None):
+    # Trips are packed with the other trips bound for the same shard, and the
+    # packed record is pinned to that shard, so trips sharing a partition key
+    # still land on the same shard. Like plain records, their order is not
+    # guaranteed once a record has to be sent again, see KinesisSender.py
+    target_bytes = AGGREGATION_BYTES if target_bytes is None else target_bytes
+    if not target_bytes:
+        return list(entries)
+
+    shards = open_shards(kinesis_client, stream_name)
+    pending = {}
+    records = []
+
+    def flush(index):
+        parts, first, _ = pending.pop(index)
+        records.append({
+            'Data': MAGIC + b''.join(parts),
+            'PartitionKey': first['PartitionKey'],
+            'ExplicitHashKey': shards[index]['HashKeyRange']['StartingHashKey']
+        })
+
+    for entry in entries:
+        index = shard_index(shards, entry)
+        part = LENGTH.pack(len(entry['Data'])) + entry['Data']
+        if index in pending and pending[index][2] + len(part) > target_bytes:
+            flush(index)
+        if index not in pending:
+            pending[index] = [[], entry, len(MAGIC)]
+        pending[index][0].append(part)
+        pending[index][2] += len(part)
+
+    for index in list(pending):
+        flush(index)
+    return records
+
+
+def schema_dictionary(fleet):
+    # A trip of the fleet with typical values, written the way the producers
+    # serialize each column's type, the most common strings last
+    types = column_types(fleet)
+    values = []
+    for name in DICTIONARY_FIELDS[fleet]:
+        data_type = types[name]
+        if data_type == DATETIME:
+            value = '"2023-01-01 00:00:00"'
+        elif pa.types.is_string(data_type):
+            value = json.dumps(DICTIONARY_STRINGS[name])
+        elif pa.types.is_integer(data_type):
+            value = '0'
+        else:
+            value = '0.0'
+        values.append(f'"{name}":{value}')
+    trip = '{' + ','.join(values) + '}'
+    return (trip + '\n' + trip).encode()
+
+
+def dictionary_fleet(dictionary_id):
+    for fleet, fleet_id in DICTIONARY_IDS.items():
+        if fleet_id == dictionary_id:
+            return fleet
+    raise Exception(f"Unknown compression dictionary {dictionary_id}")
+
+
+def cached(key, build):
+    if key not in _codecs:
+        _codecs[key] = build()
+    return _codecs[key]
+
+
+def dictionary_content(dictionary_id):
+    return cached(('content', dictionary_id), lambda: schema_dictionary(dictionary_fleet(dictionary_id)))
+
+
+def require_zstandard():
+    if zstandard is None:
+        raise Exception("zstd compression needs the zstandard package in the layer")
+
+
+def zstd_dictionary(dictionary_id):
+    require_zstandard()
+    return cached(('zstd', dictionary_id), lambda: zstandard.ZstdCompressionDict(dictionary_content(dictionary_id), dict_type=zstandard.DICT_TYPE_RAWCONTENT))
+
+
+def compress(data, codec, dictionary_id, level=None):
+    level = COMPRESSION_LEVEL if level is None else level
+    if codec == 'zlib':
+        # Raw deflate, the header already says what it is
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary_content(dictionary_id))
+        body = compressor.compress(data) + compressor.flush()
+    elif codec == 'zstd':
+        require_zstandard()
+        compressor = cached(('zstd compressor', dictionary_id, level), lambda: zstandard.ZstdCompressor(
+            level=level, dict_data=zstd_dictionary(dictionary_id), write_dict_id=False, write_checksum=False
+        ))
+        body = compressor.compress(data)
+    else:
+        raise Exception(f"Unknown record compression {codec}")
+    return COMPRESSED_MAGIC + bytes([CODECS[codec], dictionary_id]) + body
+
+
+def decompress(data):
+    codec, dictionary_id = data[2], data[3]
+    body = data[4:]
+    if codec == CODECS['zlib']:
+        decompressor = zlib.decompressobj(-15, zdict=dictionary_content(dictionary_id))
+        return decompressor.decompress(body) + decompressor.flush()
+    if codec == CODECS['zstd']:
+        require_zstandard()
+        decompressor = cached(('zstd decompressor', dictionary_id), lambda: zstandard.ZstdDecompressor(dict_data=zstd_dictionary(dictionary_id)))
+        return decompressor.decompress(body)
+    raise Exception(f"Unknown record compression codec {codec}")
+
+
+def compress_records(entries, fleet, codec=None):
+    # Compresses the data of every entry, keys are left as they are
+    codec = codec or RECORD_COMPRESSION
+    if codec == 'none':
+        return entries
+    return [dict(entry, Data=compress(entry['Data'], codec, DICTIONARY_IDS[fleet])) for entry in entries]
+
+
+def deaggregate(data):
+    # Trip payloads held by one Kinesis record, compressed, aggregated or not
+    if data.startswith(COMPRESSED_MAGIC):
+        data = decompress(data)
+    if not data.startswith(MAGIC):
+        return [data]
+    payloads = []
+    position = len(MAGIC)
+    while position < len(data):
+        (length,) = LENGTH.unpack_from(data, position)
+        position += LENGTH.size
+        payloads.append(data[position:position + length])
+        position += length
+    return payloads
+
+
+def record_trips(record):
+    # Decoded JSON of every trip in one Kinesis record
+    for payload in deaggregate(base64.b64decode(record['kinesis']['data'])):
+        yield payload.decode('utf-8')
+
+
+def event_payloads(event):
+    # Decoded JSON of every trip in a Kinesis event, in stream order
+    for record in event['Records']:
+        yield from record_trips(record)
@@ -0,0 +1,117 @@
+import os
+import time
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from SamplerCursor import save_npy, read_npy_header, read_npy_slice
+
+# Replay mode sends trips in pickup order. A simulated clock moves forward by
+# the wall time since the last run times the speed-up factor, and every trip
+# picked up before the clock is sent. Busy hours in the source show up as
+# bigger batches, so the streams see the same load curve as the real fleet.
+
+REPLAY_STATE_ID = 'replay'
+
+# Upper bound on one batch when no target rate is set
+MAX_REPLAY_BATCH = int(os.environ.get('REPLAY_MAX_BATCH', 10000))
+
+# Sorts trips without a pickup time after every other trip
+MISSING_TIME = np.iinfo(np.int64).max
+
+
+def replay_settings():
+    # REPLAY_SPEEDUP is a factor such as 1 or 60, or 'max' to ignore pickup times
+    speedup = os.environ.get('REPLAY_SPEEDUP', '1')
+    target_eps = os.environ.get('REPLAY_TARGET_EPS')
+    seed = os.environ.get('REPLAY_SEED')
+    return {
+        'speedup': speedup if speedup == 'max' else float(speedup),
+        'target_eps': float(target_eps) if target_eps else None,
+        'seed': int(seed) if seed else None
+    }
+
+
+def build_replay_index(s3_client, parquet_file, bucket, order_key, times_key, pickup_column):
+    # Only the pickup column is read, one row group at a time. The sort itself
+    # needs every pickup time in memory, about 24 bytes per row at its peak,
+    # so unlike the rest of chunked mode it does not fit a fixed budget. It
+    # runs once per source, build it with more memory for very large files.
+    times = np.empty(parquet_file.metadata.num_rows, dtype=np.int64)
+    start = 0
+    for group in range(parquet_file.num_row_groups):
+        column = parquet_file.read_row_group(group, columns=[pickup_column]).column(0)
+        if pa.types.is_timestamp(column.type):
+            column = pc.cast(column, pa.timestamp('s'), safe=False)
+        column = pc.fill_null(column.cast(pa.int64()), MISSING_TIME).to_numpy()
+        times[start:start + len(column)] = column
+        start += len(column)
+
+    order = np.argsort(times, kind='stable')
+    save_npy(s3_client, bucket, order_key, order.astype(np.uint32 if len(order) < 2 ** 32 else np.uint64))
+    times = times[order]
+    del order
+    save_npy(s3_client, bucket, times_key, times)
+
+
+def load_replay_state(dynamodb_table):
+    item = dynamodb_table.get_item(Key={'ID': REPLAY_STATE_ID}).get('Item')
+    if item is None:
+        return None
+    return {'offset': int(item['offset']), 'event_time_ms': int(item['event_time_ms']), 'wall_time_ms': int(item['wall_time_ms'])}
+
+
+def save_replay_state(dynamodb_table, state, previous_offset):
+    # Fails if another run moved the replay on in the meantime
+    item = {'ID': REPLAY_STATE_ID}
+    item.update(state)
+    if previous_offset is None:
+        dynamodb_table.put_item(Item=item, ConditionExpression='attribute_not_exists(ID)')
+    else:
+        dynamodb_table.put_item(
+            Item=item,
+            ConditionExpression='#offset = :previous',
+            ExpressionAttributeNames={'#offset': 'offset'},
+            ExpressionAttributeValues={':previous': previous_offset}
+        )
+
+
+def next_replay_positions(s3_client, dynamodb_table, parquet_file, bucket, order_key, times_key, pickup_column, min_records, max_records, settings=None):
+    settings = settings or replay_settings()
+    try:
+        times_header = read_npy_header(s3_client, bucket, times_key)
+        order_header = read_npy_header(s3_client, bucket, order_key)
+    except s3_client.exceptions.NoSuchKey:
+        # First run, sort the source by pickup time once
+        build_replay_index(s3_client, parquet_file, bucket, order_key, times_key, pickup_column)
+        times_header = read_npy_header(s3_client, bucket, times_key)
+        order_header = read_npy_header(s3_client, bucket, order_key)
+
+    now_ms = int(time.time() * 1000)
+    state = load_replay_state(dynamodb_table)
+    previous_offset = None if state is None else state['offset']
+    if state is None:
+        first = read_npy_slice(s3_client, bucket, times_key, times_header, 0, 1)
+        state = {'offset': 0, 'event_time_ms': int(first[0]) * 1000 if len(first) else 0, 'wall_time_ms': now_ms}
+
+    offset = state['offset']
+    elapsed = max(now_ms - state['wall_time_ms'], 0) / 1000
+    rng = np.random.default_rng(None if settings['seed'] is None else [settings['seed'], offset])
+    cap = int(settings['target_eps'] * elapsed) if settings['target_eps'] else MAX_REPLAY_BATCH
+
+    if settings['speedup'] == 'max':
+        # As fast as allowed, pickup times only decide the order
+        count = cap if settings['target_eps'] else int(rng.integers(min_records, max_records + 1))
+        times = read_npy_slice(s3_client, bucket, times_key, times_header, offset, offset + count)
+        count = len(times)
+        event_time_ms = int(times[-1]) * 1000 if count else state['event_time_ms']
+    else:
+        # Everything picked up before the simulated clock, at most cap trips
+        horizon_ms = state['event_time_ms'] + int(elapsed * settings['speedup'] * 1000)
+        times = read_npy_slice(s3_client, bucket, times_key, times_header, offset, offset + cap)
+        count = int(np.searchsorted(times, horizon_ms // 1000, side='right'))
+        # A capped batch leaves the clock at the last trip sent, so it catches up later
+        event_time_ms = horizon_ms if count < cap or count == 0 else int(times[count - 1]) * 1000
+
+    positions = read_npy_slice(s3_client, bucket, order_key, order_header, offset, offset + count)
+    save_replay_state(dynamodb_table, {'offset': offset + count, 'event_time_ms': event_time_ms, 'wall_time_ms': now_ms}, previous_offset)
+    return positions, (offset, offset + count)
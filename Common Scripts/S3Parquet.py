@@ -0,0 +1,104 @@
+import io
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Parquet reads that only download what they use. The footer is fetched with a
+# ranged GET, then only the row groups and columns that are asked for.
+
+
+class S3RangeFile(io.RawIOBase):
+    # Read-only file over an S3 object, every read is a ranged GET
+    def __init__(self, s3_client, bucket, key):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = s3_client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.size - self.position)
+        if length <= 0:
+            return 0
+        response = self.s3_client.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f'bytes={self.position}-{self.position + length - 1}'
+        )
+        data = response['Body'].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def open_parquet(s3_client, bucket, key):
+    # Without a client the key is a local path, a local S3 stand-in only needs
+    # a client created with its endpoint_url
+    if s3_client is None:
+        return pq.ParquetFile(key, pre_buffer=True)
+    return pq.ParquetFile(S3RangeFile(s3_client, bucket, key), pre_buffer=True)
+
+
+def row_group_sizes(parquet_file):
+    metadata = parquet_file.metadata
+    return np.array([metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)], dtype=np.int64)
+
+
+def take_from_batches(batches, local_positions):
+    # Same as take on the whole row group, one record batch in memory at a time
+    order = np.argsort(local_positions, kind='stable')
+    wanted = local_positions[order]
+    parts = []
+    offset = 0
+    for batch in batches:
+        low, high = np.searchsorted(wanted, [offset, offset + batch.num_rows])
+        if high > low:
+            parts.append(pa.Table.from_batches([batch.take(pa.array(wanted[low:high] - offset))]))
+        offset += batch.num_rows
+        if high == len(wanted):
+            break
+    table = pa.concat_tables(parts)
+    return table.take(pa.array(np.argsort(order, kind='stable')))
+
+
+def read_rows(parquet_file, positions, columns=None, batch_rows=None):
+    # Download only the row groups that hold the positions, in position order.
+    # With batch_rows the groups are decoded in record batches of that size.
+    positions = np.asarray(positions, dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(row_group_sizes(parquet_file))])
+    groups = np.searchsorted(starts, positions, side='right') - 1
+
+    tables = []
+    taken = []
+    for group in np.unique(groups):
+        in_group = np.flatnonzero(groups == group)
+        if batch_rows:
+            batches = parquet_file.iter_batches(batch_size=batch_rows, row_groups=[int(group)], columns=columns)
+            tables.append(take_from_batches(batches, positions[in_group] - starts[group]))
+        else:
+            table = parquet_file.read_row_group(int(group), columns=columns)
+            tables.append(table.take(pa.array(positions[in_group] - starts[group])))
+        taken.append(in_group)
+
+    if not tables:
+        return parquet_file.schema_arrow.empty_table().select(columns or parquet_file.schema_arrow.names)
+    table = pa.concat_tables(tables)
+    return table.take(pa.array(np.argsort(np.concatenate(taken), kind='stable')))
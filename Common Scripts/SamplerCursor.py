@@ -0,0 +1,91 @@
+import io
+import numpy as np
+
+# Cursor mode walks the source once, either in file order or through a stored
+# random permutation, and keeps a single offset watermark in the checkpoint
+# table. Each run only touches the next slice of positions.
+
+# A .npy header is padded to a multiple of 64 bytes and rarely exceeds 128
+NPY_HEADER_BYTES = 128
+
+# The shuffle is seeded so samplers racing on the first run write the same file
+PERMUTATION_SEED = 0
+
+
+def cursor_id(order):
+    return f'cursor-{order}'
+
+
+def claim_range(dynamodb_table, order, count):
+    # Atomically move the watermark forward and return the slice it covered,
+    # so concurrent samplers never get the same rows
+    response = dynamodb_table.update_item(
+        Key={'ID': cursor_id(order)},
+        UpdateExpression='ADD watermark :count',
+        ExpressionAttributeValues={':count': count},
+        ReturnValues='UPDATED_OLD'
+    )
+    start = int(response.get('Attributes', {}).get('watermark', 0))
+    return start, start + count
+
+
+def save_permutation(s3_client, bucket, key, group_sizes):
+    # Row groups are visited in random order and rows are shuffled inside each
+    # group, so a slice of the permutation only touches one or two row groups
+    rng = np.random.default_rng(PERMUTATION_SEED)
+    starts = np.concatenate([[0], np.cumsum(group_sizes)])
+    dtype = np.uint32 if starts[-1] < 2 ** 32 else np.uint64
+    permutation = np.concatenate(
+        [starts[group] + rng.permutation(group_sizes[group]) for group in rng.permutation(len(group_sizes))]
+    ).astype(dtype)
+    save_npy(s3_client, bucket, key, permutation)
+
+
+def save_npy(s3_client, bucket, key, array, **conditions):
+    # Every checkpoint array is stored as .npy, the cursor permutation, the replay
+    # order and times and the fingerprint index. conditions go to the PUT, such as IfMatch
+    with io.BytesIO() as buffer:
+        np.save(buffer, array, allow_pickle=False)
+        buffer.seek(0)
+        s3_client.put_object(Bucket=bucket, Key=key, Body=buffer, **conditions)
+
+
+def read_npy_header(s3_client, bucket, key):
+    response = s3_client.get_object(Bucket=bucket, Key=key, Range=f'bytes=0-{NPY_HEADER_BYTES - 1}')
+    header = io.BytesIO(response['Body'].read())
+    if np.lib.format.read_magic(header) == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(header)
+    else:
+        shape, _, dtype = np.lib.format.read_array_header_2_0(header)
+    return shape[0], np.dtype(dtype), header.tell()
+
+
+def read_npy_slice(s3_client, bucket, key, header, start, stop):
+    # Ranged GET of just the positions between start and stop
+    length, dtype, data_offset = header
+    stop = min(stop, length)
+    if start >= stop:
+        return np.empty(0, dtype=np.int64)
+    first_byte = data_offset + start * dtype.itemsize
+    last_byte = data_offset + stop * dtype.itemsize - 1
+    response = s3_client.get_object(Bucket=bucket, Key=key, Range=f'bytes={first_byte}-{last_byte}')
+    return np.frombuffer(response['Body'].read(), dtype=dtype).astype(np.int64)
+
+
+def next_positions(s3_client, dynamodb_table, bucket, key, group_sizes, num_records, order):
+    num_rows = int(np.sum(group_sizes))
+    if order == 'shuffled':
+        try:
+            header = read_npy_header(s3_client, bucket, key)
+        except s3_client.exceptions.NoSuchKey:
+            # First run, shuffle the source once
+            save_permutation(s3_client, bucket, key, group_sizes)
+            header = read_npy_header(s3_client, bucket, key)
+        if header[0] != num_rows:
+            raise Exception(f"Permutation {key} has {header[0]} rows but the source has {num_rows}")
+
+    # The claimed range is returned too, the checkpoint item records it
+    start, stop = claim_range(dynamodb_table, order, num_records)
+    if order == 'shuffled':
+        return read_npy_slice(s3_client, bucket, key, header, start, stop), (start, stop)
+    return np.arange(min(start, num_rows), min(stop, num_rows), dtype=np.int64), (start, stop)
@@ -0,0 +1,144 @@
+import io
+import os
+import numpy as np
+import pyarrow.parquet as pq
+from CheckpointIndex import load_index, index_from_checkpoint, record_fingerprints, select_unsent_row_groups, checkpoint_item
+from FleetSchemas import conform_table
+from BatchKeys import batch_key
+from S3Parquet import open_parquet, read_rows, row_group_sizes
+from SourceCache import open_source
+from SamplerCursor import next_positions
+from ReplayMode import next_replay_positions
+from ChunkedReader import MEMORY_BUDGET_MB, rows_for_budget, reset_peak_rss, peak_rss_mb
+
+# One sampler for every fleet, the fleets only differ by the settings below.
+# Checkpoint objects (fingerprint index, cursor permutation, replay order) are
+# kept in the source bucket under checkpoints/<fleet>_*.npy. Fleets with a
+# memory_budget_mb read their source in chunks sized to fit in it, straight from
+# S3 with ranged GETs, since the source cache decodes whole row groups. The
+# replay index is the exception, it is built in memory once per source, see
+# ReplayMode.py.
+
+SOURCE_BUCKET = 'taxisourcefiles'
+
+FLEETS = {
+    'yellow': {
+        'source_key': 'yellow_final.parquet',
+        'checkpoint_table': 'yellowCheckPoint',
+        'target_bucket': 'yellowtarget',
+        'pickup_column': 'tpep_pickup_datetime'
+    },
+    'green': {
+        'source_key': 'green_final.parquet',
+        'checkpoint_table': 'check',
+        'target_bucket': 'greentarget',
+        'pickup_column': 'lpep_pickup_datetime'
+    },
+    'fhv': {
+        'source_key': 'fhv_final.parquet',
+        'checkpoint_table': 'FhvCheckPoint',
+        'target_bucket': 'fhvtarget',
+        'pickup_column': 'pickup_datetime'
+    },
+    'hvfhv': {
+        'source_key': 'fhvhv_final.parquet',
+        'checkpoint_table': 'hvfhvCheckTable',
+        'target_bucket': 'hvfhvtarget',
+        'pickup_column': 'pickup_datetime',
+        'memory_budget_mb': MEMORY_BUDGET_MB
+    }
+}
+
+
+def checkpoint_key(fleet, name):
+    return f'checkpoints/{fleet}_{name}.npy'
+
+
+def sample_fleet(fleet, s3_client, dynamodb_resource, num_records, min_records, max_records):
+    config = FLEETS[fleet]
+
+    # Pick unsent records by fingerprint, walk the source with a cursor or replay it by pickup time
+    sampler_mode = os.environ.get('SAMPLER_MODE', 'fingerprint')
+    cursor_order = os.environ.get('CURSOR_ORDER', 'shuffled')
+
+    # Peak memory is reported for this run only, not since the container started
+    run_peak = False
+    if config.get('memory_budget_mb'):
+        run_peak = reset_peak_rss()
+
+    # Open the source file, warm containers reuse their cached copy if it is unchanged
+    try:
+        if config.get('memory_budget_mb'):
+            parquet_file = open_parquet(s3_client, SOURCE_BUCKET, config['source_key'])
+        else:
+            parquet_file = open_source(s3_client, SOURCE_BUCKET, config['source_key'])
+
+    except Exception as e:
+        raise Exception(f"Failed to read data from S3: {e}")
+
+    # Check if there are any records in the Parquet file
+    if parquet_file.metadata.num_rows == 0:
+        raise Exception("No records found in the Parquet file")
+
+    # Chunked mode decodes record batches that fit the memory budget instead of whole row groups
+    batch_rows = None
+    if config.get('memory_budget_mb'):
+        batch_rows = rows_for_budget(parquet_file.schema_arrow, config['memory_budget_mb'])
+
+    # Pick records that have not been sent yet
+    claimed = None
+    try:
+        dynamodb_table = dynamodb_resource.Table(config['checkpoint_table'])
+        if sampler_mode == 'cursor':
+            positions, claimed = next_positions(s3_client, dynamodb_table, SOURCE_BUCKET, checkpoint_key(fleet, 'permutation'), row_group_sizes(parquet_file), num_records, cursor_order)
+            records_to_insert = read_rows(parquet_file, positions, batch_rows=batch_rows)
+        elif sampler_mode == 'replay':
+            positions, claimed = next_replay_positions(
+                s3_client, dynamodb_table, parquet_file, SOURCE_BUCKET,
+                checkpoint_key(fleet, 'replay_order'), checkpoint_key(fleet, 'replay_times'),
+                config['pickup_column'], min_records, max_records
+            )
+            records_to_insert = read_rows(parquet_file, positions, batch_rows=batch_rows)
+        else:
+            sent_index, index_etag = load_index(s3_client, SOURCE_BUCKET, checkpoint_key(fleet, 'fingerprints'))
+            if index_etag is None:
+                # No index object, first run or it was lost: rebuild it from the checkpoint items
+                sent_index = index_from_checkpoint(dynamodb_table)
+            records_to_insert, fingerprints = select_unsent_row_groups(parquet_file, sent_index, num_records, np.random.default_rng(), batch_rows)
+
+    except Exception as e:
+        raise Exception(f"Failed to select records to send: {e}")
+
+    if records_to_insert.num_rows == 0:
+        print('No records to send from', config['source_key'])
+        return {'fleet': fleet, 'records': 0, 'batch_key': None}
+
+    # Cast and fill the batch with the declared fleet schema
+    s3batch = conform_table(records_to_insert, fleet)
+
+    # Write the batch to S3 as a Parquet file under its own key
+    s3_key = batch_key(fleet)
+    with io.BytesIO() as buffer:
+        pq.write_table(s3batch, buffer)
+        buffer.seek(0)
+        s3_client.upload_fileobj(buffer, config['target_bucket'], s3_key)
+
+    print('Records sents are:', s3batch.num_rows, 'to', s3_key)
+
+    # Record the batch in the checkpoint table as one compact item
+    if claimed is not None:
+        item = checkpoint_item(s3_key, s3batch.num_rows, claimed=claimed)
+    else:
+        item = checkpoint_item(s3_key, s3batch.num_rows, fingerprints=fingerprints)
+    dynamodb_table.put_item(Item=item)
+
+    # Record the batch in the index only once it has been handed over
+    if claimed is None:
+        record_fingerprints(s3_client, SOURCE_BUCKET, checkpoint_key(fleet, 'fingerprints'), sent_index, index_etag, fingerprints)
+
+    result = {'fleet': fleet, 'records': s3batch.num_rows, 'batch_key': s3_key}
+    if batch_rows:
+        result['peak_rss_mb'] = peak_rss_mb()
+        # Fleets sampled alongside in the same process count towards it too
+        print('Peak RSS (MB) of this run:' if run_peak else 'Peak RSS (MB) since the container started:', result['peak_rss_mb'], 'with', batch_rows, 'rows per chunk')
+    return result
@@ -0,0 +1,189 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+import pyarrow as pa
+from botocore.exceptions import ClientError
+from S3Parquet import open_parquet
+
+# Warm containers keep a decoded copy of each source file in /tmp as a
+# memory-mapped Arrow file. It is revalidated with a conditional HEAD on every
+# run, so warm runs skip both the download and the Parquet decoding.
+#
+# Whether a source fits is decided from the decoded sizes in its footer before
+# anything is converted, and a source that does not fit is remembered by ETag,
+# so later runs go straight to the ranged reader without downloading it again.
+
+CACHE_DIR = '/tmp/source-cache'
+
+# Total size of the cached Arrow files, larger sources are read from S3 directly
+MAX_CACHE_BYTES = int(os.environ.get('SOURCE_CACHE_BYTES', 512 * 1024 * 1024))
+
+# (bucket, key) -> {'etag', 'path', 'size', 'source'}, least recently used first
+_cache = OrderedDict()
+
+# (bucket, key) -> ETag of a source too big for the cache
+_oversized = {}
+
+# Samplers of several fleets can share the cache from different threads
+_lock = threading.Lock()
+
+
+class CachedSource:
+    # Same reads the samplers make on a ParquetFile, record batch i of the
+    # Arrow file holds row group i of the source
+    def __init__(self, path):
+        self.reader = pa.ipc.open_file(pa.memory_map(path))
+        self.schema_arrow = self.reader.schema
+        self.num_row_groups = self.reader.num_record_batches
+        sizes = [self.reader.get_batch(i).num_rows for i in range(self.num_row_groups)]
+        self.metadata = SimpleNamespace(
+            num_rows=sum(sizes),
+            num_row_groups=self.num_row_groups,
+            row_group=lambda i: SimpleNamespace(num_rows=sizes[i])
+        )
+
+    def read_row_group(self, i, columns=None):
+        table = pa.Table.from_batches([self.reader.get_batch(i)])
+        return table.select(columns) if columns else table
+
+    def iter_batches(self, batch_size, row_groups=None, columns=None):
+        # Zero-copy slices of the memory-mapped batches
+        for group in range(self.num_row_groups) if row_groups is None else row_groups:
+            batch = self.reader.get_batch(group)
+            if columns:
+                batch = batch.select(columns)
+            for start in range(0, batch.num_rows, batch_size):
+                yield batch.slice(start, batch_size)
+
+    def read(self, columns=None):
+        table = self.reader.read_all()
+        return table.select(columns) if columns else table
+
+
+def cache_path(bucket, key, etag):
+    name = hashlib.sha1(f'{bucket}/{key}/{etag}'.encode()).hexdigest()
+    return os.path.join(CACHE_DIR, f'{name}.arrow')
+
+
+def write_arrow_copy(parquet_file, path):
+    # One row group at a time, so converting never holds the whole file
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, parquet_file.schema_arrow) as writer:
+            for group in range(parquet_file.num_row_groups):
+                table = parquet_file.read_row_group(group).combine_chunks()
+                batches = table.to_batches()
+                writer.write_batch(batches[0] if batches else pa.RecordBatch.from_pylist([], schema=table.schema))
+
+
+def value_bytes(field, column, num_rows):
+    # Arrow size of one column chunk: fixed-width values at their width,
+    # strings as offsets plus the average of their shortest and longest value
+    if pa.types.is_boolean(field.type):
+        return num_rows // 8 + 1
+    try:
+        return num_rows * field.type.byte_width
+    except ValueError:
+        pass
+    offsets = 8 if pa.types.is_large_string(field.type) or pa.types.is_large_binary(field.type) else 4
+    statistics = column.statistics
+    if statistics is not None and statistics.has_min_max and isinstance(statistics.min, (str, bytes)):
+        return num_rows * (offsets + (len(statistics.min) + len(statistics.max)) // 2)
+    return num_rows * offsets + column.total_uncompressed_size
+
+
+def decoded_bytes(parquet_file):
+    # Estimated size of the Arrow copy, from the footer alone. The encoded
+    # sizes understate dictionary and run-length encoded columns, so each
+    # column also counts its values at their Arrow width.
+    metadata = parquet_file.metadata
+    schema = parquet_file.schema_arrow
+    total = 0
+    for i in range(metadata.num_row_groups):
+        group = metadata.row_group(i)
+        values = 0
+        for j in range(group.num_columns):
+            column = group.column(j)
+            position = schema.get_field_index(column.path_in_schema)
+            if position >= 0:
+                values += value_bytes(schema.field(position), column, group.num_rows)
+        total += max(group.total_byte_size, values)
+    return total
+
+
+def evict(cache_key):
+    entry = _cache.pop(cache_key, None)
+    if entry is not None and os.path.exists(entry['path']):
+        os.remove(entry['path'])
+
+
+def cached_bytes():
+    return sum(entry['size'] for entry in _cache.values())
+
+
+def open_source(s3_client, bucket, key):
+    cache_key = (bucket, key)
+    with _lock:
+        entry = _cache.get(cache_key)
+        oversized_etag = _oversized.get(cache_key)
+
+    try:
+        if entry is not None:
+            head = s3_client.head_object(Bucket=bucket, Key=key, IfNoneMatch=entry['etag'])
+        elif oversized_etag is not None:
+            head = s3_client.head_object(Bucket=bucket, Key=key, IfNoneMatch=oversized_etag)
+        else:
+            head = s3_client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('304', 'NotModified'):
+            raise
+        if entry is None:
+            # Unchanged and still too big, read it from S3
+            return open_parquet(s3_client, bucket, key)
+        # Unchanged since it was cached
+        with _lock:
+            if cache_key in _cache:
+                _cache.move_to_end(cache_key)
+        return entry['source']
+
+    # New or changed source, only its footer is read here
+    with _lock:
+        _oversized.pop(cache_key, None)
+        if entry is not None:
+            evict(cache_key)
+    parquet_file = open_parquet(s3_client, bucket, key)
+    estimate = decoded_bytes(parquet_file)
+    if estimate > MAX_CACHE_BYTES:
+        with _lock:
+            _oversized[cache_key] = head['ETag']
+        return parquet_file
+
+    # Make room by dropping the least recently used sources, before writing
+    with _lock:
+        while _cache and cached_bytes() + estimate > MAX_CACHE_BYTES:
+            evict(next(iter(_cache)))
+
+    path = cache_path(bucket, key, head['ETag'])
+    try:
+        write_arrow_copy(parquet_file, path)
+    except OSError as e:
+        # /tmp is full, read this run from S3
+        print(f"Failed to cache {key}: {e}")
+        if os.path.exists(path):
+            os.remove(path)
+        return parquet_file
+    size = os.path.getsize(path)
+    if size > MAX_CACHE_BYTES:
+        os.remove(path)
+        with _lock:
+            _oversized[cache_key] = head['ETag']
+        return parquet_file
+
+    source = CachedSource(path)
+    with _lock:
+        while _cache and cached_bytes() + size > MAX_CACHE_BYTES:
+            evict(next(iter(_cache)))
+        _cache[cache_key] = {'etag': head['ETag'], 'path': path, 'size': size, 'source': source}
+    return source
@@ -0,0 +1,104 @@
+import os
+import time
+import queue
+import threading
+from collections import Counter
+import pyarrow as pa
+from ChunkedReader import rows_for_budget, reset_peak_rss, peak_rss_mb
+from FleetSchemas import epoch_timestamps
+from KinesisSender import send_records
+from Partitioning import partition_keys, shard_skew
+from RecordCodec import serialize_records, aggregate_records, compress_records
+
+# The producers stream a batch object to Kinesis one record batch at a time.
+# A background thread decodes the next batches while the current one is being
+# sent, so the first records go out before the whole object is decoded and
+# memory stays the same for any size of object.
+
+# Rows per record batch, lowered further to fit MEMORY_BUDGET_MB
+STREAM_BATCH_ROWS = int(os.environ.get('STREAM_BATCH_ROWS', 10000))
+
+# Decoded batches waiting to be sent
+PREFETCH_BATCHES = 2
+
+# 'string' sends datetimes as '%Y-%m-%d %H:%M:%S', 'epoch' as integer seconds.
+# Consumers read both, so producers can be switched one at a time.
+WIRE_TIMESTAMPS = os.environ.get('WIRE_TIMESTAMPS', 'string')
+
+_DONE = object()
+
+
+def decoded_batches(parquet_file, batch_rows, fleet):
+    batches = queue.Queue(maxsize=PREFETCH_BATCHES)
+    stop = threading.Event()
+
+    def put(item):
+        # Gives up once the sender has stopped, so the thread never hangs
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for batch in parquet_file.iter_batches(batch_size=batch_rows):
+                if WIRE_TIMESTAMPS == 'epoch':
+                    batch = epoch_timestamps(pa.Table.from_batches([batch]), fleet)
+                if not put(batch.to_pandas()):
+                    return
+            put(_DONE)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=read, daemon=True).start()
+    try:
+        while True:
+            item = batches.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def send_dataframe(kinesis_client, stream_name, dataframe, fleet):
+    # The partition key strategy is set with PARTITION_STRATEGY, see Partitioning.py
+    keys = partition_keys(kinesis_client, stream_name, dataframe, fleet)
+    records = [
+        {'Data': payload, **key}
+        for payload, key in zip(serialize_records(dataframe), keys)
+    ]
+    # Trips bound for the same shard are packed into one record, see RecordCodec.py
+    records = aggregate_records(kinesis_client, stream_name, records)
+    # Compressed when RECORD_COMPRESSION is set, the consumers read both
+    records = compress_records(records, fleet)
+    return send_records(kinesis_client, stream_name, records)
+
+
+def stream_parquet(parquet_file, kinesis_client, stream_name, fleet):
+    batch_rows = min(STREAM_BATCH_ROWS, rows_for_budget(parquet_file.schema_arrow))
+    stats = {'trips': 0, 'records': 0, 'requests': 0, 'retries': 0, 'throttled': 0, 'shards': Counter()}
+
+    # Peak memory of this run, or since the container started where it cannot be reset
+    run_peak = reset_peak_rss()
+    start = time.monotonic()
+    for dataframe in decoded_batches(parquet_file, batch_rows, fleet):
+        batch_stats = send_dataframe(kinesis_client, stream_name, dataframe, fleet)
+        if stats['trips'] == 0:
+            stats['first_batch_seconds'] = round(time.monotonic() - start, 3)
+        stats['trips'] += len(dataframe)
+        for name in ('records', 'requests', 'retries', 'throttled'):
+            stats[name] += batch_stats[name]
+        stats['shards'].update(batch_stats['shards'])
+
+    stats['seconds'] = round(time.monotonic() - start, 3)
+    stats['peak_rss_mb'] = peak_rss_mb()
+    stats['peak_rss_since'] = 'run start' if run_peak else 'container start'
+    print('Records sent:', stats)
+    print('Shard skew:', shard_skew(kinesis_client, stream_name, stats['shards']))
+    return stats
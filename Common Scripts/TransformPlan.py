@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+from itertools import groupby
+from BatchFailures import trip_record
+from FleetSchemas import DATETIME_FORMAT
+
+# Each fleet's consumer transform written down as data: the timestamps it
+# parses, the coded columns it turns into labels, the amounts it adds up and
+# the columns it drops. The label mappings are compiled once per container into
+# arrays indexed by the code, so a whole batch is decoded with a single take
+# instead of a dict lookup per trip, and all fleets share the same few
+# vectorized steps. Timestamps are read as integer seconds, from either wire
+# format, so the duration and date are plain NumPy arithmetic.
+
+VENDORS = {1: 'Creative Mobile', 2: 'VeriFone Inc', 0: 'Undefined'}
+RATE_CODES = {1: 'Standard rate', 2: 'JFK', 3: 'Newark', 4: 'Nassau or Westchester', 5: 'Negotiated fare', 6: 'Group ride', 0: 'Undefined'}
+PAYMENT_TYPES = {1: 'Credit card', 2: 'Cash', 3: 'No Charge', 4: 'Dispute', 5: 'Unknown', 6: 'Voided trip', 0: 'Undefined'}
+TRIP_TYPES = {1: 'Street hail', 2: 'Dispatch'}
+SR_FLAGS = {1: 'Shared', 0: 'Non-Shared'}
+HVFHS_LICENSES = {'HV0002': 'Juno', 'HV0003': 'Uber', 'HV0004': 'Via', 'HV0005': 'Lyft'}
+SHARED_MATCH_FLAGS = {'N': 'Not shared', 'Y': 'Shared'}
+
+# lookups: (code column, label column, mapping, dtype of the labels or None)
+# totals: column -> amounts added up in this order
+PLANS = {
+    'yellow': {
+        'pickup': 'tpep_pickup_datetime',
+        'dropoff': 'tpep_dropoff_datetime',
+        'lookups': [
+            ('VendorID', 'Vendor', VENDORS, None),
+            ('RatecodeID', 'RateCode', RATE_CODES, None),
+            ('payment_type', 'Payment', PAYMENT_TYPES, None)
+        ],
+        'totals': {},
+        'drop': ['tpep_pickup_datetime', 'VendorID', 'tpep_dropoff_datetime', 'store_and_fwd_flag', 'RatecodeID', 'PULocationID', 'DOLocationID', 'payment_type']
+    },
+    'green': {
+        'pickup': 'lpep_pickup_datetime',
+        'dropoff': 'lpep_dropoff_datetime',
+        'lookups': [
+            ('VendorID', 'Vendor', VENDORS, None),
+            ('RatecodeID', 'RateCode', RATE_CODES, None),
+            ('payment_type', 'Payment', PAYMENT_TYPES, None),
+            ('trip_type', 'type_of_trip', TRIP_TYPES, None)
+        ],
+        'totals': {},
+        'drop': ['lpep_pickup_datetime', 'VendorID', 'lpep_dropoff_datetime', 'store_and_fwd_flag', 'RatecodeID', 'PULocationID', 'DOLocationID', 'ehail_fee', 'payment_type', 'trip_type']
+    },
+    'fhv': {
+        'pickup': 'pickup_datetime',
+        'dropoff': 'dropOff_datetime',
+        'lookups': [
+            ('SR_Flag', 'SR_Flag', SR_FLAGS, None)
+        ],
+        'totals': {},
+        'drop': ['pickup_datetime', 'dropOff_datetime', 'PUlocationID', 'DOlocationID', 'Affiliated_base_number']
+    },
+    'hvfhv': {
+        'pickup': 'pickup_datetime',
+        'dropoff': 'dropoff_datetime',
+        'lookups': [
+            ('hvfhs_license_num', 'hvfhs_license_num', HVFHS_LICENSES, 'string'),
+            ('shared_match_flag', 'shared_match_flag', SHARED_MATCH_FLAGS, 'string')
+        ],
+        'totals': {
+            'trip_total_amount': ['base_passenger_fare', 'tolls', 'bcf', 'sales_tax', 'congestion_surcharge', 'airport_fee', 'tips', 'driver_pay']
+        },
+        'drop': ['on_scene_datetime', 'originating_base_num', 'access_a_ride_flag', 'pickup_datetime', 'dropoff_datetime', 'PULocationID', 'DOLocationID', 'wav_request_flag', 'shared_request_flag', 'base_passenger_fare', 'tolls', 'bcf', 'sales_tax', 'congestion_surcharge', 'airport_fee', 'driver_pay']
+    }
+}
+
+SECONDS_PER_DAY = 86400
+
+# fleet -> plan with compiled lookups, kept by warm containers
+_compiled = {}
+
+# Day number since the epoch -> 'YYYY-MM-DD', kept by warm containers
+_days = {}
+
+
+def compile_lookup(mapping):
+    # Integer codes index an array of labels whose last slot holds the label
+    # for unknown codes. String codes keep their dict, see decode()
+    if all(isinstance(code, int) for code in mapping):
+        labels = np.full(max(mapping) + 2, np.nan, dtype=object)
+        for code, label in mapping.items():
+            labels[code] = label
+        return labels
+    return mapping
+
+
+def compiled_plan(fleet):
+    if fleet not in _compiled:
+        plan = dict(PLANS[fleet])
+        plan['lookups'] = [
+            (source, target, compile_lookup(mapping), dtype)
+            for source, target, mapping, dtype in plan['lookups']
+        ]
+        _compiled[fleet] = plan
+    return _compiled[fleet]
+
+
+def decode(values, lookup):
+    # Labels for a column of codes, NaN where the code is missing or unknown
+    if isinstance(lookup, dict):
+        # Only the distinct codes of the batch go through the dict
+        categorical = pd.Categorical(values)
+        labels = np.array([lookup.get(code, np.nan) for code in categorical.categories] + [np.nan], dtype=object)
+        return labels.take(categorical.codes)
+    codes = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    unknown = len(lookup) - 1
+    known = (codes >= 0) & (codes < unknown) & (codes == np.floor(codes))
+    return lookup.take(np.where(known, codes, unknown).astype(np.int64))
+
+
+def epoch_seconds(values):
+    # Integer seconds since the epoch and a mask of missing values. Producers
+    # send integers with WIRE_TIMESTAMPS=epoch and strings otherwise.
+    if pd.api.types.is_numeric_dtype(values):
+        seconds = values.to_numpy(dtype=float)
+        missing = np.isnan(seconds)
+        return np.where(missing, 0, seconds).astype(np.int64), missing
+    try:
+        parsed = pd.to_datetime(values, format=DATETIME_FORMAT)
+    except (ValueError, TypeError):
+        # Both formats in one batch while producers are being switched
+        numbers = pd.to_numeric(values, errors='coerce')
+        parsed = pd.to_datetime(values.where(numbers.isna()), format=DATETIME_FORMAT)
+        parsed = parsed.fillna(pd.to_datetime(numbers, unit='s'))
+    parsed = parsed.to_numpy(dtype='datetime64[s]')
+    missing = np.isnat(parsed)
+    return np.where(missing, 0, parsed.view(np.int64)), missing
+
+
+def day_strings(seconds, missing):
+    # 'YYYY-MM-DD' of every timestamp, formatted once per distinct day
+    days, inverse = np.unique(seconds // SECONDS_PER_DAY, return_inverse=True)
+    for day in days:
+        if day not in _days:
+            _days[day] = str(np.datetime64(int(day), 'D'))
+    labels = np.array([_days[day] for day in days] + [np.nan], dtype=object)
+    return labels.take(np.where(missing, len(days), inverse.reshape(-1)))
+
+
+def transform(dataframe, fleet):
+    # Runs the fleet's plan over the whole batch, in place
+    plan = compiled_plan(fleet)
+
+    # Duration and date in integer seconds, without datetime objects
+    pickup, pickup_missing = epoch_seconds(dataframe[plan['pickup']])
+    dropoff, dropoff_missing = epoch_seconds(dataframe[plan['dropoff']])
+    duration = np.round((dropoff - pickup) / 60, 2)
+    duration[pickup_missing | dropoff_missing] = np.nan
+    dataframe['Trip_Duration'] = duration
+    dataframe['date'] = day_strings(pickup, pickup_missing)
+
+    for source, target, lookup, dtype in plan['lookups']:
+        labels = pd.Series(decode(dataframe[source], lookup), index=dataframe.index)
+        dataframe[target] = labels.astype(dtype) if dtype else labels
+
+    for target, columns in plan['totals'].items():
+        # Added in the listed order so the rounding matches the per-trip sum
+        total = dataframe[columns[0]]
+        for column in columns[1:]:
+            total = total + dataframe[column]
+        dataframe[target] = total.astype(float).round(2)
+
+    dataframe.drop(columns=plan['drop'], inplace=True)
+    return dataframe
+
+
+def transform_trips(trips, trip_keys, fleet, failures):
+    # The whole batch in one frame. When a bad trip breaks the vectorized pass
+    # the records are transformed one at a time and the bad ones quarantined.
+    if not trips:
+        return pd.DataFrame(), []
+    try:
+        return transform(pd.DataFrame.from_records(trips), fleet), trip_keys
+    except Exception as e:
+        print(f"Failed to transform the batch, transforming record by record: {e}")
+
+    frames = []
+    keys = []
+    for key, positions in groupby(range(len(trips)), key=lambda position: trip_record(trip_keys[position])):
+        positions = list(positions)
+        try:
+            frames.append(transform(pd.DataFrame.from_records([trips[position] for position in positions]), fleet))
+        except Exception as e:
+            failures.quarantine(key, e)
+            continue
+        keys.extend(trip_keys[position] for position in positions)
+    if not frames:
+        return pd.DataFrame(), []
+    return pd.concat(frames, ignore_index=True), keys
@@ -1,110 +1,53 @@
-import json
-import base64
 import boto3
-import pandas as pd
 from datetime import datetime
+from Deduplication import unseen_trips, remember_records, trip_ids
+from BatchWriter import write_items
+from TransformPlan import transform_trips
+from BatchFailures import RecordFailures
+from DynamoCodec import ITEM_SCHEMAS
 
-def get_last_id(dynamodb, table_name):
-    response = dynamodb.scan(
-        TableName=table_name,
-        ProjectionExpression='ID'
-    )
-
-    items = response['Items']
-    max_id = 0
-
-    while 'LastEvaluatedKey' in response:
-        response = dynamodb.scan(
-            TableName=table_name,
-            ProjectionExpression='ID',
-            ExclusiveStartKey=response['LastEvaluatedKey']
-        )
-        items.extend(response['Items'])
-
-    for item in items:
-        id_value = int(item['ID']['N'])
-        if id_value > max_id:
-            max_id = id_value
-
-    return max_id
 
 def lambda_handler(event, context):
+    failures = RecordFailures(event, 'fhv')
     try:
         # Initialize a DynamoDB client
         dynamodb = boto3.client('dynamodb')
         table_name = 'FhvTable'
-        max_id = get_last_id(dynamodb, table_name)
-        print(max_id)
-        
-        # List to hold the items for batch write
-        batch_items = []
-
-        for record in event['Records']:
-            data = record['kinesis']['data']
-            decoded_data = base64.b64decode(data).decode('utf-8')  # Decode the data if it is base64 encoded
-
-            # Assuming each record is a separate item, write it to DynamoDB directly
-
-            # Parse the decoded_data as JSON
-            json_data = json.loads(decoded_data)
 
-            # Convert the JSON data to a DataFrame
-            fhv_df = pd.DataFrame.from_records([json_data])
+        # Decode every trip in the event, aggregated records are unpacked. Records this
+        # container already wrote are dropped and bad records quarantined, see BatchFailures.py
+        trip_keys, trips = unseen_trips(event, failures)
 
-            # Perform the provided transformations
-            fhv_df['pickup_datetime'] = pd.to_datetime(fhv_df['pickup_datetime'], format='%Y-%m-%d %H:%M:%S')
-            fhv_df['dropOff_datetime'] = pd.to_datetime(fhv_df['dropOff_datetime'], format='%Y-%m-%d %H:%M:%S')
-            fhv_df['Trip_Duration'] = round((fhv_df['dropOff_datetime'] - fhv_df['pickup_datetime']).dt.total_seconds() / 60, 2)
-            fhv_df['date'] = fhv_df['pickup_datetime'].dt.date.astype(str)
-            fhv_df['SR_Flag'] = fhv_df['SR_Flag'].replace({1: 'Shared', 0: 'Non-Shared'})
+        # Perform the provided transformations on the whole batch at once, see TransformPlan.py
+        fhv_df, trip_keys = transform_trips(trips, trip_keys, 'fhv', failures)
+        if not trip_keys:
+            return failures.response('No records to write.')
 
-            columns_to_drop = ['pickup_datetime', 'dropOff_datetime', 'PUlocationID', 'DOlocationID', 'Affiliated_base_number']
-            fhv_df.drop(columns=columns_to_drop, inplace=True)
+        ingestion_date = datetime.now().strftime('%d/%m/%Y')
+        fhv_df['Ingestion_Date'] = ingestion_date
 
-            ingestion_date = datetime.now().strftime('%d/%m/%Y')
-            fhv_df['Ingestion_Date'] = ingestion_date
+        fhv_df.reset_index(drop=True, inplace=True)
+        new_order = ['ID', 'dispatching_base_num', 'date', 'SR_Flag', 'Trip_Duration', 'Ingestion_Date']
+        fhv_df = fhv_df.reindex(columns=new_order)
 
-            fhv_df.reset_index(drop=True, inplace=True)
-            new_order = ['ID', 'dispatching_base_num', 'date', 'SR_Flag', 'Trip_Duration', 'Ingestion_Date']
-            fhv_df = fhv_df.reindex(columns=new_order)
+        # One ID per trip, in stream order, from the shared ID counter or from the
+        # record's sequence number when ID_MODE=sequence
+        fhv_df['ID'] = trip_ids(dynamodb, table_name, trip_keys)
 
-            # Generate a new ID for each row
-            fhv_df['ID'] = range(max_id + 1, max_id + 1 + len(fhv_df))
-            max_id += len(fhv_df)
+        # Encode the frame column by column into DynamoDB items, see DynamoCodec.py
+        batch_items = ITEM_SCHEMAS['fhv'].put_requests(fhv_df)
 
-            # Convert DataFrame rows to dictionaries and append to batch_items
-            for row in fhv_df.itertuples(index=False):
-                item = {
-                    'PutRequest': {
-                        'Item': {
-                            'ID': {'N': str(row.ID)},
-                            'dispatching_base_num': {'S': row.dispatching_base_num},
-                            'date': {'S': str(row.date)},
-                            'SR_Flag': {'S': row.SR_Flag},
-                            'Trip_Duration': {'N': str(row.Trip_Duration)},
-                            'Ingestion_Date': {'S': row.Ingestion_Date}
-                        }
-                    }
-                }
-                batch_items.append(item)
+        # Batch write the items to DynamoDB, 25 per request from a few workers.
+        # Unprocessed items are retried with backoff, see BatchWriter.py
+        stats = write_items(dynamodb, table_name, batch_items)
+        failures.items_failed(trip_keys, stats)
 
-        # Batch write the items to DynamoDB
-        while batch_items:
-            response = dynamodb.batch_write_item(
-                RequestItems={
-                    table_name: batch_items[:25]  # Write up to 25 items per batch
-                }
-            )
-            unprocessed_items = response.get('UnprocessedItems', {})
-            batch_items = unprocessed_items.get(table_name, [])
+        # Redeliveries of the written records are dropped by this container from now on
+        remember_records(event, skip=failures.failed)
 
-        return {
-            'statusCode': 200,
-            'body': 'Data successfully written to DynamoDB.'
-        }
+        return failures.response('Data successfully written to DynamoDB.')
 
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'body': str(e)
-        }
+        # Not tied to a record, so the batch is retried from its first record
+        failures.retry_all(e)
+        return failures.response(str(e))
@@ -1,45 +1,30 @@
-import pandas as pd
-import io
 import boto3
-import random
+from S3Parquet import open_parquet
+from BatchKeys import event_objects
+from StreamProducer import stream_parquet
 
 def lambda_handler(event, context):
     # Set up the AWS clients
     s3_client = boto3.client('s3')
     kinesis_client = boto3.client('kinesis')
 
-    # Specify the S3 bucket and object key
-    s3_bucket = 'yellowtarget'
-    s3_object_key = 'yellowbatch.parquet'
-
     # Specify the Kinesis Data Stream name
     kinesis_stream_name = 'yellow-stream'
 
 
-    # Read the Parquet file from S3
-    try:
-        response = s3_client.get_object(Bucket=s3_bucket, Key=s3_object_key)
-        parquet_file = response['Body'].read()
-        dataframe = pd.read_parquet(io.BytesIO(parquet_file))
-
-        
-    except Exception as e:
-        raise Exception(f"Failed to read data from S3: {e}")
-
-    # Check if there are any records
-    if dataframe.empty:
-        raise Exception("No records found in the Parquet file")
-
+    # Send every batch object named in the S3 event
+    for s3_bucket, s3_object_key in event_objects(event):
+        # Open the Parquet file on S3, only its footer is read here
+        try:
+            parquet_file = open_parquet(s3_client, s3_bucket, s3_object_key)
 
-    # Send the records to Kinesis Data Stream
-    for _, record in dataframe.iterrows():
-        print("Record:", record)
-        kinesis_client.put_record(
-            StreamName=kinesis_stream_name,
-            Data=record.to_json().encode(),
-            PartitionKey=str(1)
-        )
+        except Exception as e:
+            raise Exception(f"Failed to read data from S3: {e}")
 
+        # Check if there are any records
+        if parquet_file.metadata.num_rows == 0:
+            raise Exception("No records found in the Parquet file")
 
-# Call the lambda_handler function to trigger it manually
-lambda_handler(None, None)
+        # Stream the records to Kinesis Data Stream one record batch at a time,
+        # the next batches are decoded while the current one is sent
+        stream_parquet(parquet_file, kinesis_client, kinesis_stream_name, 'yellow')